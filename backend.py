@@ -1,21 +1,37 @@
-import pygsheets
+import io
 import os
+import json
+import warnings
 import numpy as np
-from datetime import date,timedelta
+from functools import lru_cache
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 
-def get_data(service_account_file='key.json',spreadsheet_id_file='spreadsheet_id.txt'):
+from profiling import timed
+
+data_columns_id=[('Weight [kg]',2),('Waist [cm]',3),('Body fat [%]',4),('Body fat [kg]',5),('Hydration [%]',6)]
+info_columns_id=[('Activity',7),('Notes',8)]
+column_count=1+len(data_columns_id)+len(info_columns_id)
+#relative key, ID and cache paths are resolved against this directory rather than the working directory
+module_dir=os.path.dirname(os.path.abspath(__file__))
+
+def get_data(service_account_file='key.json',spreadsheet_id_file='spreadsheet_id.txt',batched=True,cache_dir=None,changes=False):
     """
     Parse Google spreadsheet data
     Inputs:
     service_account_file: Google Service Account key of .json-format 
     spreadsheet_id_file: .txt-file containing the spreadsheet ID
+    batched: True to fetch all columns in a single request, False to fetch one column per request
+    cache_dir: directory for the on-disk cache (see sync_cache), None to always fetch and parse the full sheet
+    changes: True to only return the entries that may have changed since the last sync, see sync_cache (requires cache_dir)
 
     See readMe.txt for details.
 
     Outputs:
     dates_formatted: List of strings of the form YYYY,MM,DD for all non-year rows
     data_dict: dictionary with keys=data column descriptors, values=column data values
-    info_columns_dict: dictionary with keys=info column descriptors, values=column info strings
+    info_columns_dict: dictionary with keys=info column descriptors, values=column info strings (a list or text_column)
 
     Assumes the spread sheet data to be of the form:
     Column 1: Dates of the format DD/MM, e.g. 1/7 (1st of June), 21/8 (21st of August), 1/12 (1st of December), 23/12 (23rd of December)
@@ -29,165 +45,1676 @@ def get_data(service_account_file='key.json',spreadsheet_id_file='spreadsheet_id
     Column 7: Activity (Text input)
     Column 8: Notes (Text input)
     """
-    os.chdir(os.path.dirname(__file__))
+    #imported here since the Google client stack is slow to import and not needed for cached or mock data
+    import pygsheets
     #authorize
-    gc=pygsheets.authorize(service_account_file=service_account_file)
+    gc=pygsheets.authorize(service_account_file=os.path.join(module_dir,service_account_file))
     #open google spreadsheet
-    with open(spreadsheet_id_file) as f:
+    with open(os.path.join(module_dir,spreadsheet_id_file)) as f:
         key=f.read()
     worksheet=gc.open_by_key(key)[0]
-    date_column=worksheet.get_col(1)[1:]
-    N=len(date_column)
-    data_columns_id=[('Weight [kg]',2),('Waist [cm]',3),('Body fat [%]',4),('Body fat [kg]',5),('Hydration [%]',6)]
-    info_columns_id=[('Activity',7),('Notes',8)]
+    if cache_dir is not None:
+        return sync_cache(worksheet,os.path.join(module_dir,cache_dir,key.strip()),batched,changes=changes)
+    _,columns=fetch_columns(worksheet,batched)
+    return parse_columns(columns)
+
+def load_cached_data(spreadsheet_id_file='spreadsheet_id.txt',cache_dir='cache'):
+    """
+    Load the data cached by get_data without any network access
+
+    Inputs:
+    spreadsheet_id_file: .txt-file containing the spreadsheet ID
+    cache_dir: directory passed to get_data
+
+    Outputs: tuple of dates_formatted, data_dict, info_columns_dict as described in get_data, None if nothing is cached
+    """
+    try:
+        with open(os.path.join(module_dir,spreadsheet_id_file)) as f:
+            key=f.read()
+    except OSError:
+        return None
+    #read into memory rather than memory-mapped: on Windows a mapped file can't be replaced by the next sync
+    cached=load_cache(os.path.join(module_dir,cache_dir,key.strip()),mmap=False)
+    if cached is None:
+        return None
+    return cached[:3]
+
+@timed('sheets_fetch')
+def fetch_columns(worksheet,batched=True,row_count=None):
+    """
+    Fetch the spreadsheet columns described in get_data
+
+    Inputs:
+    worksheet: pygsheets.Worksheet or local_worksheet to fetch from
+    batched: True to fetch the A:H block in a single values request, False to make one get_col request per column
+    row_count: number of rows to fetch from the top of the sheet, header row included, None to fetch all rows
+
+    Outputs:
+    header: list of the header cell strings
+    columns: list with one list of cell strings per column, header row excluded, all columns padded to the same length
+    """
+    if row_count is None:
+        row_count=worksheet.rows
+    row_count=min(row_count,worksheet.rows)
+    if batched:
+        columns=worksheet.get_values((1,1),(row_count,column_count),majdim='COLUMNS',
+                                     include_tailing_empty=True,include_tailing_empty_rows=True)
+        columns=list(columns)+[[] for _ in range(column_count-len(columns))]
+    else:
+        columns=[worksheet.get_col(i)[:row_count] for i in range(1,column_count+1)]
+    N=max(len(column) for column in columns)
+    columns=[list(column)+['']*(N-len(column)) for column in columns]
+    return [column[0] if N else '' for column in columns],[column[1:] for column in columns]
+
+@timed('parse')
+def parse_columns(columns,bad_cells=None,return_rows=False):
+    """
+    Parse fetched spreadsheet columns, see get_data for the expected layout. The columns are converted as a whole,
+    see parse_date_column and parse_number_column, rows and cells that cannot be parsed are reported instead of
+    guessed: rows with a malformed date cell are skipped and malformed data cells are left empty.
+
+    Inputs:
+    columns: list with one list of cell strings per column, header row excluded
+    bad_cells: list that (row, column descriptor, cell, reason)-tuples of malformed cells are appended to, rows are
+               counted from 1 at the header row. None to issue a warning summarizing them instead.
+    return_rows: True to also return the index in columns of each entry's row
+
+    Outputs: dates_formatted, data_dict, info_columns_dict as described in get_data (and the row indices)
+    """
+    report=[] if bad_cells is None else bad_cells
+    reported_count=len(report)
+    dates,rows=parse_date_column(columns[0],report)
     data_dict={}
-    data_columns=[]
     for key,i in data_columns_id:
-        data_dict[key]=[]
-        data_columns.append(worksheet.get_col(i)[1:])
+        values,bad=parse_number_column(columns[i-1])
+        for row in np.flatnonzero(bad[rows]):
+            report.append((int(rows[row])+2,key,columns[i-1][rows[row]],'not a number'))
+        data_dict[key]=values[rows]
     info_columns_dict={}
-    info_columns=[]
     for key,i in info_columns_id:
-        info_columns_dict[key]=[]
-        info_columns.append(worksheet.get_col(i)[1:])
-    dates_formatted=[]
-    valid_count=0
-    for i,date in enumerate(date_column[::-1]):
-        if date=='':
-            continue
-        try:
-            day,month=date.split('/')
-            dates_formatted.append(f"{currentYear},{('0'+month)[-2:]},{('0'+day)[-2:]}")
-            for ii,(_,_list) in enumerate(data_dict.items()):
-                y_value=data_columns[ii][N-1-i].replace(' ','.')
-                if y_value=='' or float(y_value)==0:
-                    y_value=np.nan
-                else:
-                    y_value=float(y_value)
-                _list.append(y_value)
-            for ii,(_,_list) in enumerate(info_columns_dict.items()):
-                _list.append(info_columns[ii][N-1-i])
-        except:
-            currentYear=date
-        valid_count+=1
-    for key,_list in data_dict.items():
-        data_dict[key]=np.array(_list)
+        info_columns_dict[key]=text_column.from_strings(np.asarray(columns[i-1],dtype=object)[rows])
+    dates_formatted=format_dates(dates)
+    if bad_cells is None and len(report)>reported_count:
+        row,key,cell,reason=report[reported_count]
+        warnings.warn(f"{len(report)-reported_count} malformed cells ignored, the first in row {row} ({key}): {cell!r} is {reason}")
+    if return_rows:
+        return dates_formatted,data_dict,info_columns_dict,rows
+    return dates_formatted,data_dict,info_columns_dict
+
+pow10=10.0**np.arange(23)
+
+def format_dates(dates):
+    """
+    Convert a datetime64 array (years 0 to 9999) to a list of strings of the form YYYY,MM,DD, the characters are
+    written into the code points of a fixed-width string array
+    """
+    dates=np.asarray(dates,dtype='datetime64[D]')
+    years=dates.astype('datetime64[Y]')
+    months=dates.astype('datetime64[M]')
+    digits=[years.astype(np.int64)+1970,(months-years).astype(np.int64)+1,(dates-months).astype(np.int64)+1]
+    codes=np.full((len(dates),10),44,dtype=np.uint32)
+    for column,(part,scale) in zip([0,1,2,3,5,6,8,9],[(0,1000),(0,100),(0,10),(0,1),(1,10),(1,1),(2,10),(2,1)]):
+        codes[:,column]=digits[part]//scale%10+48
+    return codes.view('U10').ravel().tolist()
+
+def scan_cells(cells,separators):
+    """
+    Read the digits of each cell as one integer with array operations over the concatenated cells, noting the
+    position of a separator (e.g. a decimal point) so that the integer can be split into the parts before and after it
+
+    Inputs:
+    cells: list of cell strings
+    separators: byte string with the separator characters
+
+    Outputs: dictionary of arrays with one entry per cell:
+    digits: value of all digits read as one integer, exact for up to 15 digits
+    digit_count: number of digits
+    after_count: number of digits after the (last) separator
+    separator_count: number of separators
+    other_count: number of other characters, spaces and a leading sign excluded
+    sign: leading '-' (-1), '+' (1) or none (0)
+    length: number of characters
+    """
+    N=len(cells)
+    text='\n'.join(cells)+'\n' if N else ''
+    if text.count('\n')!=N:
+        text='\n'.join(cell.replace('\n',' ') for cell in cells)+'\n'
+    #non-ASCII characters become '?' and therefore count as other characters
+    codes=np.frombuffer(text.encode('ascii',errors='replace'),dtype=np.uint8)
+    ends=np.flatnonzero(codes==10)
+    starts=np.concatenate(([0],ends[:-1]+1)) if N else ends
+    digits=codes-np.uint8(48)
+    is_digit=digits<10
+    digit_sum=np.cumsum(is_digit,dtype=np.int64)
+    digit_count=np.diff(digit_sum[ends],prepend=0)
+    #a digit is worth 10**(digits after it in its cell)
+    powers=np.repeat(digit_sum[ends],np.diff(ends,prepend=-1))-digit_sum
+    weights=np.where(is_digit,pow10[np.minimum(powers,22)]*digits,0.0)
+    is_separator=codes==separators[0]
+    for separator in separators[1:]:
+        is_separator|=codes==separator
+    #separators and other characters are rare, so they are assigned to their cells by binary search
+    separator_positions=np.flatnonzero(is_separator)
+    separator_cells=np.searchsorted(ends,separator_positions)
+    after_count=np.zeros(N,dtype=np.int64)
+    after_count[separator_cells]=digit_sum[ends][separator_cells]-digit_sum[separator_positions]
+    first=codes[starts]
+    sign=np.where(first==45,-1,np.where(first==43,1,0))
+    other_positions=np.flatnonzero(~(is_digit|is_separator|(codes==32)|(codes==10)))
+    return {'digits':np.add.reduceat(weights,starts) if N else np.zeros(0),'digit_count':digit_count,'after_count':after_count,
+            'separator_count':np.bincount(separator_cells,minlength=N),
+            'other_count':np.bincount(np.searchsorted(ends,other_positions),minlength=N)-(sign!=0),
+            'sign':sign,'length':ends-starts}
+
+def parse_number_column(cells):
+    """
+    Convert data cells to floats in one pass, a space is read as the decimal point. Empty cells and zeros become NaN.
+    Columns with malformed cells are converted again cell by cell to find them.
+
+    Outputs: float array and boolean array marking the cells that are not numbers
+    """
+    N=len(cells)
+    #empty cells are filled in on the joined text, so the conversion is a single map over the cells
+    text=('\n'+'\n'.join(cells)+'\n').replace(' ','.').replace('\n\n','\nnan\n').replace('\n\n','\nnan\n')
+    bad=np.zeros(N,dtype=bool)
+    try:
+        if text.count('\n')!=N+1:
+            raise ValueError('a cell contains a line break')
+        values=np.fromiter(map(float,text[1:-1].split('\n')),dtype=float,count=N) if N else np.zeros(0)
+    except ValueError:
+        values=np.full(N,np.nan)
+        for i,cell in enumerate(cells):
+            if cell=='':
+                continue
+            try:
+                values[i]=float(cell.replace(' ','.'))
+            except ValueError:
+                bad[i]=True
+    values[values==0]=np.nan
+    return values,bad
+
+def parse_date_column(cells,bad_cells=None):
+    """
+    Parse the date column (DD/MM date rows below YYYY year rows, most recent at the top). The year of each date row is
+    the year of the nearest year row below it, found with a forward fill in chronological order. Spaces are ignored.
+
+    Inputs:
+    cells: date column cell strings, header row excluded
+    bad_cells: list to append (row, 'Date', cell, reason)-tuples of malformed date cells to, see parse_columns
+
+    Outputs: datetime64[D] array of the dates in chronological order, indices in cells of their rows
+    """
+    N=len(cells)
+    scan=scan_cells(cells,b'/')
+    digits=scan['digits'].astype(np.int64)
+    day_digits=scan['digit_count']-scan['after_count']
+    clean=(scan['other_count']==0)&(scan['sign']==0)
+    is_empty=clean&(scan['separator_count']==0)&(scan['digit_count']==0)
+    is_year=clean&(scan['separator_count']==0)&(scan['digit_count']>0)&(scan['digit_count']<=4)
+    is_date=clean&(scan['separator_count']==1)&(day_digits>0)&(day_digits<=2)&(scan['after_count']>0)&(scan['after_count']<=2)
+    #chronological order is bottom to top, the year of a row is that of the last year row before it
+    order=np.arange(N)[::-1]
+    year_row=np.where(is_year[order],np.arange(N),-1)
+    np.maximum.accumulate(year_row,out=year_row)
+    years=np.where(year_row>=0,digits[order][np.maximum(year_row,0)],-1)
+    month_scale=10**scan['after_count'][order]
+    months=digits[order]%month_scale
+    days=digits[order]//month_scale
+    month_starts=(years-1970).astype('datetime64[Y]').astype('datetime64[M]')+np.clip(months-1,0,11)
+    dates=month_starts.astype('datetime64[D]')+np.maximum(days-1,0)
+    valid=is_date[order]&(years>=0)&(months>=1)&(months<=12)&(days>=1)&(dates.astype('datetime64[M]')==month_starts)
+    if bad_cells is not None:
+        for i in np.flatnonzero(~valid&~is_empty[order]&~is_year[order]):
+            row=int(order[i])
+            if not is_date[row]:
+                reason='not a date (DD/MM) or year'
+            elif years[i]<0:
+                reason='a date without a year row below it'
+            else:
+                reason='not a valid date'
+            bad_cells.append((row+2,'Date',cells[row],reason))
+    return dates[valid],order[valid]
+
+def is_year_cell(cell):
+    """
+    Check whether a date column cell marks a year row, i.e. consists of up to 4 digits (spaces are ignored)
+    """
+    cell=cell.replace(' ','')
+    return 0<len(cell)<=4 and cell.isascii() and cell.isdigit()
+
+@timed('cache_sync')
+def sync_cache(worksheet,cache_dir,batched=True,overlap_rows=8,anchor_rows=8,changes=False):
+    """
+    Bring the on-disk cache in cache_dir up to date with the worksheet and return the parsed data.
+    When a cache exists and the sheet's header is unchanged and its row count has not decreased, only the
+    rows added at the top plus the overlap_rows most recent rows before the last sync are fetched and
+    parsed, so that edits to the latest entries are picked up, and only the tails of the cache files are rewritten.
+    The anchor_rows rows below them are fetched as well and must equal the ones stored at the last sync, otherwise the
+    row count grew for another reason (e.g. empty rows added at the bottom) and the full sheet is fetched.
+
+    Inputs:
+    worksheet: pygsheets.Worksheet or local_worksheet to fetch from
+    cache_dir: directory containing the cache files, created if missing
+    batched: see fetch_columns
+    overlap_rows: number of previously synced rows at the top of the sheet to fetch again
+    anchor_rows: number of rows below the overlap rows checked to line up with the cache
+    changes: True to only return the entries of the dates that may have changed, i.e. all entries dated on or after
+             the first re-parsed one (all entries when the full sheet was fetched), read from the end of the cache files
+
+    Outputs: dates_formatted, data_dict, info_columns_dict as described in get_data
+    """
+    meta=load_cache_meta(cache_dir)
+    if meta is not None:
+        delta=worksheet.rows-meta['row_count']
+        if delta>=0 and meta['overlap_rows']==overlap_rows and meta['base_year'] is not None:
+            header,columns=fetch_columns(worksheet,batched,1+delta+overlap_rows+anchor_rows)
+            anchor=[column[delta+overlap_rows:] for column in columns]
+            columns=[column[:delta+overlap_rows] for column in columns]
+            if header==meta['header'] and anchor==meta.get('anchor'):
+                #a year row is added below the fetched rows so that they are parsed with the year in effect there
+                top_columns=[column+[meta['base_year'] if i==0 else ''] for i,column in enumerate(columns)]
+                new_dates,new_data_dict,new_info_columns_dict,rows=parse_columns(top_columns,return_rows=True)
+                keep=meta['entry_count']-meta['overlap_entry_count']
+                base_year=next((cell for cell in columns[0][overlap_rows:] if is_year_cell(cell)),meta['base_year'])
+                new_meta=cache_meta(header,worksheet.rows,overlap_rows,base_year,int(np.sum(rows<overlap_rows)),
+                                    [(column[overlap_rows:]+anchor_column)[:anchor_rows] for column,anchor_column in zip(columns,anchor)])
+                try:
+                    update_cache(cache_dir,keep,new_dates,new_data_dict,new_info_columns_dict,new_meta)
+                    if changes:
+                        #entries before keep dated on the first re-parsed date are returned as well, their dates are
+                        #read back from the cache overlap_rows entries at a time
+                        first_date=new_dates[0] if new_dates else None
+                        start=keep
+                        while first_date is not None and start>0:
+                            previous_dates=read_array_slice(os.path.join(cache_dir,'dates.npy'),max(start-overlap_rows,0),start)
+                            same_date=int(np.sum(previous_dates==first_date))
+                            start-=same_date
+                            if same_date<len(previous_dates):
+                                break
+                        cached=load_cache_tail(cache_dir,start)
+                    else:
+                        cached=load_cache(cache_dir,mmap=False)
+                except (OSError,ValueError):
+                    cached=None
+                if cached is not None:
+                    return cached[:3]
+    header,columns=fetch_columns(worksheet,batched)
+    dates_formatted,data_dict,info_columns_dict,rows=parse_columns(columns,return_rows=True)
+    base_year=next((cell for cell in columns[0][overlap_rows:] if is_year_cell(cell)),None)
+    meta=cache_meta(header,worksheet.rows,overlap_rows,base_year,int(np.sum(rows<overlap_rows)),
+                    [column[overlap_rows:overlap_rows+anchor_rows] for column in columns])
+    save_cache(cache_dir,dates_formatted,data_dict,info_columns_dict,meta)
     return dates_formatted,data_dict,info_columns_dict
 
-def get_mock_data():
+def cache_meta(header,row_count,overlap_rows,base_year,overlap_entry_count,anchor):
+    """
+    Collect the metadata sync_cache needs for the next incremental refresh
+
+    Inputs:
+    header: list of the header cell strings
+    row_count: row count of the sheet
+    overlap_rows: see sync_cache
+    base_year: year in effect for the rows below the overlap rows
+    overlap_entry_count: number of parsed entries within the overlap rows
+    anchor: list with the cells of the rows below the overlap rows, one list per column (see sync_cache)
+
+    Output: dictionary with the metadata
+    """
+    return {'version':2,'header':list(header),'row_count':row_count,'overlap_rows':overlap_rows,
+            'overlap_entry_count':overlap_entry_count,'base_year':base_year,'anchor':[list(column) for column in anchor]}
+
+def save_cache(cache_dir,dates_formatted,data_dict,info_columns_dict,meta):
+    """
+    Store parsed data column by column as .npy files that can be memory-mapped by load_cache.
+    Info columns are stored as the arrays of a text_column: the UTF-8 buffer, the rows of the non-empty entries and their byte offsets.
+
+    Inputs:
+    cache_dir: directory to store the cache files in, created if missing
+    dates_formatted, data_dict, info_columns_dict: as described in get_data
+    meta: dictionary with metadata, see cache_meta
+    """
+    os.makedirs(cache_dir,exist_ok=True)
+    remove_cache_meta(cache_dir)
+    save_array(os.path.join(cache_dir,'dates.npy'),np.array(dates_formatted,dtype='U10'))
+    for i,key in enumerate(data_dict.keys()):
+        save_array(os.path.join(cache_dir,f"data_{i}.npy"),np.asarray(data_dict[key],dtype=float))
+    for i,key in enumerate(info_columns_dict.keys()):
+        buffer,rows,offsets=text_column.from_strings(info_columns_dict[key]).arrays()
+        save_array(os.path.join(cache_dir,f"info_{i}.npy"),buffer)
+        save_array(os.path.join(cache_dir,f"info_{i}_rows.npy"),rows)
+        save_array(os.path.join(cache_dir,f"info_{i}_offsets.npy"),offsets)
+    save_cache_meta(cache_dir,meta,data_dict,info_columns_dict,len(dates_formatted))
+
+def update_cache(cache_dir,keep,dates_formatted,data_dict,info_columns_dict,meta):
+    """
+    Replace the entries from entry keep on of the data stored by save_cache, only the ends of the files are rewritten
+
+    Inputs:
+    cache_dir: directory containing the cache files
+    keep: number of stored entries to keep
+    dates_formatted, data_dict, info_columns_dict: entries following the kept ones, as described in get_data
+    meta: dictionary with metadata, see cache_meta
+    """
+    remove_cache_meta(cache_dir)
+    entry_count=replace_array_tail(os.path.join(cache_dir,'dates.npy'),keep,np.array(dates_formatted,dtype='U10'))
+    for i,key in enumerate(data_dict.keys()):
+        if replace_array_tail(os.path.join(cache_dir,f"data_{i}.npy"),keep,np.asarray(data_dict[key],dtype=float))!=entry_count:
+            raise ValueError(f"Cached column {key} does not match the dates")
+    for i,key in enumerate(info_columns_dict.keys()):
+        path=os.path.join(cache_dir,f"info_{i}")
+        position,byte_offset=cached_text_position(path,keep,entry_count)
+        buffer,rows,offsets=text_column.from_strings(info_columns_dict[key]).arrays()
+        replace_array_tail(path+'.npy',byte_offset,buffer)
+        replace_array_tail(path+'_rows.npy',position,rows+keep)
+        replace_array_tail(path+'_offsets.npy',position+1,offsets[1:]+byte_offset)
+    save_cache_meta(cache_dir,meta,data_dict,info_columns_dict,keep+len(dates_formatted))
+
+def save_cache_meta(cache_dir,meta,data_dict,info_columns_dict,entry_count):
+    """
+    Write the metadata of a cache with the given columns and number of entries, see save_cache
+    """
+    meta=dict(meta,data_keys=list(data_dict.keys()),info_keys=list(info_columns_dict.keys()),entry_count=entry_count)
+    with open(os.path.join(cache_dir,'meta.json'),'w') as f:
+        json.dump(meta,f)
+
+def remove_cache_meta(cache_dir):
+    """
+    Remove the metadata before the cache files are changed, so that an interrupted save leaves a cache that load_cache rejects
+    """
+    try:
+        os.remove(os.path.join(cache_dir,'meta.json'))
+    except FileNotFoundError:
+        pass
+
+def save_array(path,array):
+    """
+    Save an array as a .npy file by writing a temporary file and renaming it over path. Arrays memory-mapped from
+    the previous file by load_cache keep reading it on POSIX systems, truncating it in place would make reading them
+    crash the process (on Windows the rename fails while the file is mapped, so the loaded cache is read into memory).
+    """
+    temporary_path=path+'.tmp'
+    with open(temporary_path,'wb') as f:
+        np.save(f,array)
+    os.replace(temporary_path,path)
+
+def read_array_header(f):
+    """
+    Read the header of an open .npy file of a 1-D array, leaving the file at the start of the data
+
+    Output: length, dtype and format version of the array
+    """
+    version=np.lib.format.read_magic(f)
+    read_header=np.lib.format.read_array_header_1_0 if version==(1,0) else np.lib.format.read_array_header_2_0
+    shape,_,dtype=read_header(f)
+    if len(shape)!=1:
+        raise ValueError(f"{f.name} does not contain a 1-D array")
+    return shape[0],dtype,version
+
+def read_array_slice(path,start,end=None):
+    """
+    Output: the elements start:end (0<=start) of the 1-D array in the .npy file path, only their bytes are read
+    """
+    with open(path,'rb') as f:
+        length,dtype,_=read_array_header(f)
+        start,end,_=slice(start,end).indices(length)
+        f.seek(start*dtype.itemsize,os.SEEK_CUR)
+        return np.frombuffer(f.read(max(end-start,0)*dtype.itemsize),dtype=dtype).copy()
+
+def replace_array_tail(path,start,array):
+    """
+    Replace the elements from start on of the 1-D array in the .npy file path by array. The file is changed in place:
+    the data is written from the replaced element on and the length in the header is updated, np.save leaves room in
+    the header for the length to grow.
+
+    Output: previous length of the array
+    """
+    with open(path,'r+b') as f:
+        length,dtype,version=read_array_header(f)
+        data_start=f.tell()
+        if not 0<=start<=length:
+            raise ValueError(f"Can not replace the elements from {start} on of the {length} in {path}")
+        array=np.asarray(array,dtype=dtype)
+        header=io.BytesIO()
+        write_header=np.lib.format.write_array_header_1_0 if version==(1,0) else np.lib.format.write_array_header_2_0
+        write_header(header,{'descr':np.lib.format.dtype_to_descr(dtype),'fortran_order':False,'shape':(start+len(array),)})
+        if header.tell()!=data_start:
+            raise ValueError(f"The header of {path} can not be updated in place")
+        f.seek(data_start+start*dtype.itemsize)
+        f.write(array.tobytes())
+        f.truncate()
+        f.seek(0)
+        f.write(header.getvalue())
+    return length
+
+def cached_text_position(path,entry_index,entry_count):
+    """
+    Locate an entry of a text_column stored by save_cache, reading only the ends of its rows and offsets files
+
+    Inputs:
+    path: path of the column's files without the suffix and .npy extension
+    entry_index: index of the entry to locate
+    entry_count: number of entries of the column
+
+    Outputs: number of stored non-empty entries before entry_index and their length in bytes
+    """
+    #rows hold at most one non-empty entry each, so those from entry_index on are among the last entry_count-entry_index
+    with open(path+'_rows.npy','rb') as f:
+        stored_count=read_array_header(f)[0]
+    rows=read_array_slice(path+'_rows.npy',max(stored_count-(entry_count-entry_index),0))
+    position=stored_count-len(rows)+int(np.searchsorted(rows,entry_index))
+    return position,int(read_array_slice(path+'_offsets.npy',position,position+1)[0])
+
+def load_cache_meta(cache_dir):
+    """
+    Output: metadata dictionary of the cache stored by save_cache, None if there is no valid cache for the current column layout
+    """
+    try:
+        with open(os.path.join(cache_dir,'meta.json')) as f:
+            meta=json.load(f)
+        if meta['version']!=2 or meta['data_keys']!=[key for key,_ in data_columns_id] or meta['info_keys']!=[key for key,_ in info_columns_id]:
+            return None
+    except (OSError,ValueError,KeyError):
+        return None
+    return meta
+
+def load_cache(cache_dir,mmap=True):
+    """
+    Load data stored by save_cache
+
+    Inputs:
+    cache_dir: directory containing the cache files
+    mmap: True to memory-map the data and info columns read-only instead of reading them into memory, the mapped arrays
+          change when the cache is synced
+
+    Output: tuple of dates_formatted, data_dict, info_columns_dict (as described in get_data) and the metadata
+            dictionary, None if there is no valid cache for the current column layout
+    """
+    meta=load_cache_meta(cache_dir)
+    if meta is None:
+        return None
+    try:
+        dates_formatted=np.load(os.path.join(cache_dir,'dates.npy')).tolist()
+        data_dict={}
+        for i,key in enumerate(meta['data_keys']):
+            data_dict[key]=np.load(os.path.join(cache_dir,f"data_{i}.npy"),mmap_mode='r' if mmap else None)
+        info_columns_dict={}
+        for i,key in enumerate(meta['info_keys']):
+            arrays=[np.load(os.path.join(cache_dir,f"info_{i}{suffix}.npy"),mmap_mode='r' if mmap else None) for suffix in ['','_rows','_offsets']]
+            info_columns_dict[key]=text_column(*arrays,meta['entry_count'])
+    except (OSError,ValueError,KeyError):
+        return None
+    if any(len(column)!=meta['entry_count'] for column in [dates_formatted,*data_dict.values(),*info_columns_dict.values()]):
+        return None
+    return dates_formatted,data_dict,info_columns_dict,meta
+
+def load_cache_tail(cache_dir,start_index):
+    """
+    Load the entries from start_index on of the data stored by save_cache, only their part of the files is read
+
+    Output: tuple of dates_formatted, data_dict, info_columns_dict (as described in get_data) and the metadata
+            dictionary, None if there is no valid cache for the current column layout
+    """
+    meta=load_cache_meta(cache_dir)
+    if meta is None:
+        return None
+    try:
+        dates_formatted=read_array_slice(os.path.join(cache_dir,'dates.npy'),start_index).tolist()
+        data_dict={key:read_array_slice(os.path.join(cache_dir,f"data_{i}.npy"),start_index) for i,key in enumerate(meta['data_keys'])}
+        info_columns_dict={}
+        for i,key in enumerate(meta['info_keys']):
+            path=os.path.join(cache_dir,f"info_{i}")
+            position,byte_offset=cached_text_position(path,start_index,meta['entry_count'])
+            offsets=read_array_slice(path+'_offsets.npy',position)
+            info_columns_dict[key]=text_column(read_array_slice(path+'.npy',byte_offset,int(offsets[-1])),
+                                               read_array_slice(path+'_rows.npy',position)-start_index,offsets-byte_offset,
+                                               meta['entry_count']-start_index)
+    except (OSError,ValueError,KeyError,IndexError):
+        return None
+    if any(len(column)!=meta['entry_count']-start_index for column in [dates_formatted,*data_dict.values()]):
+        return None
+    return dates_formatted,data_dict,info_columns_dict,meta
+
+class local_worksheet:
+    """
+    Offline stand-in for pygsheets.Worksheet, implementing the calls used by fetch_columns and counting
+    them in fetch_count so that request counts and parse times can be benchmarked without network access
+    """
+    def __init__(self,rows):
+        """
+        Inputs:
+        rows: list of rows, each a list of cell strings, the first row being the header
+        """
+        self.cells=[list(row) for row in rows]
+        self.rows=len(self.cells)
+        self.cols=max([len(row) for row in self.cells],default=0)
+        self.fetch_count=0
+    @classmethod
+    def from_data(cls,dates_formatted,data_dict,info_columns_dict):
+        """
+        Build a worksheet in the layout described in get_data, e.g. from the output of get_mock_data
+
+        Inputs: dates_formatted, data_dict, info_columns_dict as described in get_data
+
+        Output: local_worksheet with the most recent dates at the top and a year row above each year's dates
+        """
+        return cls.from_dataset(dataset.from_columns(dates_formatted,data_dict,info_columns_dict))
+    @classmethod
+    def from_dataset(cls,data):
+        """
+        Build a worksheet in the layout described in get_data from a dataset (with the columns of data_columns_id
+        and info_columns_id), the cells are formatted column by column
+
+        Output: local_worksheet with the most recent dates at the top and a year row above each year's dates
+        """
+        N=len(data)
+        years=data.dates.astype('datetime64[Y]')
+        months=(data.dates.astype('datetime64[M]')-years).astype(int)+1
+        days=(data.dates-data.dates.astype('datetime64[M]')).astype(int)+1
+        table=np.empty((N,column_count),dtype=object)
+        table[:,0]=np.char.add(np.char.add(days.astype(str),'/'),months.astype(str))
+        for key,i in data_columns_id:
+            values=data.data_dict[key]
+            table[:,i-1]=np.where(np.isnan(values),'',values.astype(str))
+        for key,i in info_columns_id:
+            table[:,i-1]=data.info_columns[data.info_labels.index(key)].tolist()
+        #a year row above the first date of each year
+        year_starts=np.flatnonzero(np.concatenate(([True],years[1:]!=years[:-1]))) if N else np.zeros(0,dtype=int)
+        year_rows=np.full((len(year_starts),column_count),'',dtype=object)
+        year_rows[:,0]=years[year_starts].astype(str)
+        table=np.insert(table,year_starts,year_rows,axis=0)
+        header=['Date']+[key for key,_ in data_columns_id]+[key for key,_ in info_columns_id]
+        return cls([header]+table[::-1].tolist())
+    def get_col(self,col):
+        self.fetch_count+=1
+        return [row[col-1] if col-1<len(row) else '' for row in self.cells]
+    def get_values(self,start,end,majdim='ROWS',include_tailing_empty=True,include_tailing_empty_rows=True,**kwargs):
+        self.fetch_count+=1
+        (start_row,start_col),(end_row,end_col)=start,end
+        block=[[row[j] if j<len(row) else '' for j in range(start_col-1,end_col)] for row in self.cells[start_row-1:end_row]]
+        if majdim.upper().startswith('COL'):
+            return [list(column) for column in zip(*block)]
+        return block
+
+def get_mock_data(N=1844,seed=None):
     """
-    Generate mock data for testing
+    Generate mock data for testing, see generate_data
+
+    Inputs:
+    N: number of rows
+    seed: seed of the random number generator, None for different data on every call
 
     Outputs:
     dates_formatted: List of strings of the form YYYY,MM,DD for all non-year rows
     data_dict: dictionary with keys=data column descriptors, values=column data values
     info_columns_dict: dictionary with keys=info column descriptors, values=column info strings
     """
-    start_date = date(2018,3,22)
-    end_date = date(2023,4,9)
-    dates_formatted=[str(start_date+timedelta(days=x)).replace('-',',') for x in range((end_date-start_date).days)]
-    N=len(dates_formatted)
-    data_dict={}
-    for key in ['Weight [kg]','Waist [cm]','Body fat [%]','Body fat [kg]','Hydration [%]']:
-        data_dict[key]=np.sin(np.linspace(1,N,N)+2*np.pi*np.random.random(1))*N/40+N/2+np.random.random(N)*N/20
-    info_columns_dict={}
-    for key in ['Activity','Notes']:
-        info_columns_dict[key]=[''.join([chr(int(np.random.random(1)*1000)) for _ in range(int(20*np.random.random(1)))]) for _ in range(N)]
-    return dates_formatted,data_dict,info_columns_dict
+    return generate_data(N,seed).to_columns()
+
+def extended(array,values):
+    """
+    Append values along the last axis of an array. If the array is a leading view of a writeable buffer with enough
+    spare room, the values are written behind it, otherwise into a new buffer of twice the needed length, so
+    appending repeatedly costs the number of new entries (amortized) instead of the length of the array.
+
+    Inputs:
+    array: numpy array
+    values: numpy array with the shape of array except along the last axis
+
+    Output: view of the buffer holding array followed by values, entries of the buffer behind array are overwritten
+    """
+    N=array.shape[-1]
+    new_N=N+values.shape[-1]
+    buffer=array.base
+    if (not isinstance(buffer,np.ndarray) or buffer.dtype!=array.dtype or buffer.shape[:-1]!=array.shape[:-1] or buffer.shape[-1]<new_N
+            or buffer.strides!=array.strides or buffer.ctypes.data!=array.ctypes.data or not buffer.flags.writeable):
+        buffer=np.empty(array.shape[:-1]+(max(2*new_N,16),),dtype=array.dtype)
+        buffer[...,:N]=array
+    buffer[...,N:new_N]=values
+    return buffer[...,:new_N]
+
+class date_index:
+    """
+    Index over chronologically sorted dates, resolving (partial) date strings to row indices by binary
+    search over a datetime64 array and providing the elapsed days of each row for plotting on a calendar axis
+    """
+    def __init__(self,dates,origin=None):
+        """
+        Inputs:
+        dates: datetime64 array or list of strings of the form YYYY,MM,DD, sorted chronologically (repeated dates are allowed)
+        origin: date the elapsed days are counted from, None for the first date
+        """
+        self.dates=to_datetime64(dates)
+        self.N=len(self.dates)
+        if origin is None and self.N:
+            origin=self.dates[0]
+        #elapsed days since the origin, gaps in the log show up as gaps on the axis
+        self.days=(self.dates-origin).astype(float) if self.N else np.zeros(0)
+        self.origin=origin
+        #True if the dates are the first days of consecutive periods (see calendar_aggregate), lookups then resolve to the period containing a date
+        self.period_starts=False
+    def append(self,dates):
+        """
+        Append chronologically sorted dates on or after the last date, see extended
+        """
+        dates=to_datetime64(dates)
+        if self.origin is None and len(dates):
+            self.origin=dates[0]
+        self.dates=extended(self.dates,dates)
+        self.days=extended(self.days,(dates-self.origin).astype(float))
+        self.N=len(self.dates)
+    def lookup(self,date_str,side='start'):
+        """
+        Resolve a date string to a row index
+
+        Inputs:
+        date_str: string of the form YYYY,MM,DD, YYYY,MM or YYYY (separated by ',', '-', '/', '.' or spaces)
+        side: 'start' for the first row on or after the date/period, 'end' for the last row on or before it
+
+        Output: row index, dates outside the logged range resolve to the first or last row
+        """
+        parts=[part for part in date_str.replace('-',',').replace('/',',').replace('.',',').replace(' ',',').split(',') if part!='']
+        if not 1<=len(parts)<=3 or not all(part.isnumeric() for part in parts) or self.N==0:
+            raise ValueError(f"Invalid date: {date_str}")
+        unit='YMD'[len(parts)-1]
+        period_start=np.datetime64('-'.join([parts[0].zfill(4)]+[part.zfill(2) for part in parts[1:]]),unit)
+        if side=='start' and self.period_starts:
+            index=np.searchsorted(self.dates,period_start.astype('datetime64[D]'),side='right')-1
+        elif side=='start':
+            index=np.searchsorted(self.dates,period_start.astype('datetime64[D]'),side='left')
+        else:
+            index=np.searchsorted(self.dates,(period_start+1).astype('datetime64[D]'),side='left')-1
+        return int(min(max(index,0),self.N-1))
+    def nearest_index(self,day):
+        """
+        Row index closest to a position on the elapsed days axis
+        """
+        index=int(np.searchsorted(self.days,day))
+        if index>=self.N:
+            return self.N-1
+        if index>0 and day-self.days[index-1]<=self.days[index]-day:
+            return index-1
+        return index
+    def year_starts(self):
+        """
+        Output: list of (elapsed days, year string) for every January 1st within the logged range
+        """
+        if self.N==0:
+            return []
+        years=np.arange(self.dates[0].astype('datetime64[Y]')+1,self.dates[-1].astype('datetime64[Y]')+1)
+        if self.dates[0]==self.dates[0].astype('datetime64[Y]').astype('datetime64[D]'):
+            years=np.concatenate(([self.dates[0].astype('datetime64[Y]')],years))
+        return [(float((year.astype('datetime64[D]')-self.origin).astype(int)),str(year)) for year in years]
+
+def to_datetime64(dates):
+    """
+    Convert a list of strings of the form YYYY,MM,DD (or a datetime64 array) to a datetime64[D] array
+    """
+    if isinstance(dates,np.ndarray) and np.issubdtype(dates.dtype,np.datetime64):
+        return dates.astype('datetime64[D]',copy=False)
+    return np.char.replace(np.asarray(dates,dtype='U10'),',','-').astype('datetime64[D]')
+
+class text_column:
+    """
+    Column of text entries stored compactly: the non-empty entries are UTF-8 encoded back to back in one byte array,
+    indexed by the rows holding them and their byte offsets. Empty entries take no storage and entries are decoded
+    when read, so a column costs about the size of its text instead of a Python string per row. It is read like a
+    list of strings: len, indexing by row, slicing (a view sharing the arrays) and indexing by an int array (a copy).
+    """
+    __slots__=('buffer','rows','offsets','length','first_row')
+    def __init__(self,buffer,rows,offsets,length,first_row=0):
+        """
+        Inputs:
+        buffer: uint8 array with the UTF-8 encoded entries, may be memory-mapped
+        rows: sorted int array with the rows of the non-empty entries, counted from first_row
+        offsets: int array with len(rows)+1 byte offsets into buffer, the k-th entry is buffer[offsets[k]:offsets[k+1]]
+        length: number of rows
+        first_row: value in rows of row 0
+        """
+        self.buffer=buffer
+        self.rows=rows
+        self.offsets=offsets
+        self.length=length
+        self.first_row=first_row
+    @classmethod
+    def from_strings(cls,strings):
+        """
+        Output: text_column of a sequence of strings, a text_column is returned as is
+        """
+        if isinstance(strings,text_column):
+            return strings
+        strings=np.asarray(strings,dtype=object)
+        rows=np.flatnonzero(strings.astype(bool))
+        entries=strings[rows].tolist()
+        text=''.join(entries)
+        buffer=text.encode('utf-8')
+        #for ASCII text the byte lengths are the string lengths, only other text is encoded entry by entry
+        lengths=[len(entry) for entry in entries] if len(buffer)==len(text) else [len(entry.encode('utf-8')) for entry in entries]
+        offsets=np.zeros(len(entries)+1,dtype=np.int64)
+        np.cumsum(lengths,out=offsets[1:])
+        return cls(np.frombuffer(buffer,dtype=np.uint8),rows,offsets,len(strings))
+    @classmethod
+    def concatenate(cls,columns):
+        """
+        Output: new text_column with the entries of columns (text_columns or lists of strings) one after another
+        """
+        result=cls(np.zeros(0,dtype=np.uint8),np.zeros(0,dtype=np.int64),np.zeros(1,dtype=np.int64),0)
+        for column in columns:
+            result.append(column)
+        return result
+    def __len__(self):
+        return self.length
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            start,stop,step=index.indices(self.length)
+            if step!=1:
+                return self.take(np.arange(start,stop,step))
+            stop=max(start,stop)
+            low,high=np.searchsorted(self.rows,[self.first_row+start,self.first_row+stop])
+            return text_column(self.buffer,self.rows[low:high],self.offsets[low:high+1],stop-start,self.first_row+start)
+        if isinstance(index,(np.ndarray,list)):
+            return self.take(index)
+        if index<0:
+            index+=self.length
+        if not 0<=index<self.length:
+            raise IndexError('text_column index out of range')
+        k=np.searchsorted(self.rows,self.first_row+index)
+        if k==len(self.rows) or self.rows[k]!=self.first_row+index:
+            return ''
+        return self.buffer[self.offsets[k]:self.offsets[k+1]].tobytes().decode('utf-8')
+    def __iter__(self):
+        return iter(self.tolist())
+    def __eq__(self,other):
+        if not isinstance(other,text_column):
+            return NotImplemented
+        return self.length==other.length and all(np.array_equal(a,b) for a,b in zip(self.arrays(),other.arrays()))
+    def take(self,indices):
+        """
+        Output: text_column of the entries in the rows given by an int array, copied into a new buffer
+        """
+        indices=np.asarray(indices,dtype=np.int64)
+        keys=np.where(indices<0,indices+self.length,indices)+self.first_row
+        positions=np.searchsorted(self.rows,keys)
+        found=positions<len(self.rows)
+        found[found]=self.rows[positions[found]]==keys[found]
+        positions=positions[found]
+        starts=self.offsets[positions]
+        lengths=self.offsets[positions+1]-starts
+        offsets=np.zeros(len(positions)+1,dtype=np.int64)
+        np.cumsum(lengths,out=offsets[1:])
+        #byte j of the result is byte j-offsets[k] of its entry k
+        gather=np.repeat(starts-offsets[:-1],lengths)+np.arange(offsets[-1])
+        return text_column(np.asarray(self.buffer)[gather],np.flatnonzero(found),offsets,len(indices))
+    def append(self,other):
+        """
+        Append the entries of another text_column (or list of strings) in place, the arrays are grown with spare
+        capacity (see extended). Views (slices) must not be appended to, they share the arrays of their column.
+        """
+        other=text_column.from_strings(other)
+        buffer,rows,offsets=other.arrays()
+        end=self.offsets[-1]
+        self.buffer=extended(self.buffer[:end],buffer)
+        self.offsets=extended(self.offsets,offsets[1:]+end)
+        self.rows=extended(self.rows,rows+self.first_row+self.length)
+        self.length+=other.length
+    def arrays(self):
+        """
+        Output: buffer, rows and offsets of the entries, with the rows and offsets counted from 0
+        """
+        return self.buffer[self.offsets[0]:self.offsets[-1]],self.rows-self.first_row,self.offsets-self.offsets[0]
+    def tolist(self):
+        """
+        Output: list with the string of every row
+        """
+        strings=['']*self.length
+        buffer,rows,offsets=self.arrays()
+        text=buffer.tobytes()
+        offsets=offsets.tolist()
+        for row,start,end in zip(rows.tolist(),offsets[:-1],offsets[1:]):
+            strings[row]=text[start:end].decode('utf-8')
+        return strings
+
+class dataset:
+    """
+    Loaded log shared by the History and Comparison tabs, stored as a struct of arrays: a datetime64 date column,
+    the metrics as the rows of one contiguous 2-D array and each info column as a text_column.
+    Views over a row range share the arrays of the full data set. Rows can be appended in place with append.
+    """
+    __slots__=('dates','index','days','day_numbers','labels','values','data_dict','info_labels','info_columns')
+    def __init__(self,dates,labels,values,info_labels=(),info_columns=(),origin=None):
+        """
+        Inputs:
+        dates: datetime64[D] array, sorted chronologically
+        labels: list of data column descriptors
+        values: 2-D float array with one row per data column
+        info_labels: list of info column descriptors
+        info_columns: one text_column (or list of strings) of len(dates) entries per info column
+        origin: date the elapsed days are counted from, None for the first date
+        """
+        self.dates=dates
+        self.index=date_index(dates,origin)
+        self.days=self.index.days
+        #1-based day count used as the Days variable of the Comparison tab
+        self.day_numbers=self.days+1
+        self.labels=list(labels)
+        self.values=values
+        #the row views are created once, so their identity is stable for caches keyed by id
+        self.data_dict={label:values[i] for i,label in enumerate(self.labels)}
+        self.info_labels=list(info_labels)
+        self.info_columns=tuple(text_column.from_strings(column) for column in info_columns)
+    @classmethod
+    def from_columns(cls,dates_formatted,data_dict,info_columns_dict,dtype=float):
+        """
+        Inputs:
+        dates_formatted, data_dict, info_columns_dict: as described in get_data
+        dtype: float type of the metric array, e.g. np.float32 to halve its memory use
+
+        Output: dataset
+        """
+        dates=to_datetime64(dates_formatted)
+        values=np.empty((len(data_dict),len(dates)),dtype=dtype)
+        for i,column in enumerate(data_dict.values()):
+            values[i]=column
+        return cls(dates,data_dict.keys(),values,info_columns_dict.keys(),info_columns_dict.values())
+    def __len__(self):
+        return len(self.dates)
+    def to_columns(self):
+        """
+        Output: dates_formatted, data_dict, info_columns_dict as described in get_data, the info columns are shared
+        """
+        return format_dates(self.dates),dict(self.data_dict),dict(zip(self.info_labels,self.info_columns))
+    def append(self,other):
+        """
+        Append the rows of another dataset with the same columns, dated on or after the last row. The arrays are grown
+        with spare capacity (see extended), so appending costs the number of new rows. The row views in data_dict are
+        replaced, so caches keyed by their identity recompute. Views (see view) must not be appended to, they share
+        the buffers of their dataset.
+        """
+        if other.labels!=self.labels or other.info_labels!=self.info_labels:
+            raise ValueError('Appended rows have different columns')
+        if len(other)==0:
+            return
+        if len(self) and other.dates[0]<self.dates[-1]:
+            raise ValueError('Appended rows are dated before the last row')
+        self.index.append(other.dates)
+        self.dates=self.index.dates
+        self.days=self.index.days
+        self.day_numbers=extended(self.day_numbers,self.days[-len(other):]+1)
+        self.values=extended(self.values,other.values.astype(self.values.dtype,copy=False))
+        self.data_dict={label:self.values[i] for i,label in enumerate(self.labels)}
+        for column,new_column in zip(self.info_columns,other.info_columns):
+            column.append(new_column)
+    def view(self,start_index=0,end_index=None):
+        """
+        Dataset of the rows start_index:end_index sharing the arrays of this one, elapsed days keep their origin
+        """
+        start_index,end_index,_=slice(start_index,end_index).indices(len(self))
+        end_index=max(start_index,end_index)
+        return dataset(self.dates[start_index:end_index],self.labels,self.values[:,start_index:end_index],self.info_labels,
+                       [column[start_index:end_index] for column in self.info_columns],self.index.origin)
+    def date_str(self,index):
+        """
+        Output: date of a row as a string of the form YYYY,MM,DD
+        """
+        return str(self.dates[index]).replace('-',',')
+    def info(self,label,index):
+        """
+        Output: text of an info column in a row, decoded on demand
+        """
+        return self.info_columns[self.info_labels.index(label)][index]
+    def equals(self,other):
+        """
+        Check whether two datasets contain the same values, other may be None
+        """
+        if other is None or len(self)!=len(other) or self.labels!=other.labels or self.info_labels!=other.info_labels:
+            return False
+        return (np.array_equal(self.dates,other.dates) and np.array_equal(self.values,other.values,equal_nan=True)
+                and self.info_columns==other.info_columns)
+
+mock_activities=['Run','Gym','Swim','Walk','Cycling','Football','Yoga','Rest day','Hike','Tennis']
+mock_notes=['Slept badly','Late dinner','Travelling','Ate out','Felt great','Sick','Scale recalibrated','Holiday',
+            'Stressful week','Party','New shoes','Measured after training','Cheat day','Drank a lot of water']
+
+def generate_data(N,seed=None,start_date='2018-03-22',gap_fraction=0.05,nan_fraction=0.02,max_entries_per_day=1,dtype=float):
+    """
+    Generate a log with plausible values for testing and load tests, vectorized so that tens of millions of rows
+    take seconds. Use local_worksheet.from_dataset to lay it out like the spreadsheet (with year rows).
+
+    Inputs:
+    N: number of rows
+    seed: seed of the random number generator, None for different data on every call
+    start_date: date of the first row (YYYY-MM-DD)
+    gap_fraction: fraction of the days without entries
+    nan_fraction: fraction of empty data cells
+    max_entries_per_day: each logged day gets between 1 and max_entries_per_day rows
+    dtype: float type of the metric array
+
+    Output: dataset with the columns of data_columns_id (other columns get a generic series) and info_columns_id
+    """
+    rng=np.random.default_rng(seed)
+    #logged days are separated by geometrically distributed steps, a step of 1 is the next day
+    steps=rng.geometric(1-gap_fraction,N) if gap_fraction>0 else np.ones(N,dtype=np.int64)
+    steps[0]=0
+    day_offsets=np.cumsum(steps)
+    entries_per_day=rng.integers(1,max_entries_per_day+1,N)
+    row_days=day_offsets[np.searchsorted(np.cumsum(entries_per_day),np.arange(N),side='right')]
+    if N and np.datetime64(start_date,'D')+row_days[-1]>np.datetime64('9999-12-31'):
+        raise ValueError(f"{N} rows reach past the year 9999, increase max_entries_per_day")
+    dates=np.datetime64(start_date,'D')+row_days
+    t=row_days.astype(float)
+    def slow_wave(amplitude,period):
+        return amplitude*np.sin(2*np.pi*t/period+2*np.pi*rng.random())
+    weight=80+slow_wave(4,1500)+slow_wave(1.5,365)+rng.normal(0,0.4,N)
+    body_fat_percent=20+slow_wave(3,1500)+slow_wave(1,365)+rng.normal(0,0.5,N)
+    series={'Weight [kg]':weight,'Waist [cm]':weight*1.1+rng.normal(0,0.8,N),'Body fat [%]':body_fat_percent,
+            'Body fat [kg]':weight*body_fat_percent/100,'Hydration [%]':55-0.4*(body_fat_percent-20)+rng.normal(0,0.6,N)}
+    labels=[key for key,_ in data_columns_id]
+    values=np.empty((len(labels),N),dtype=dtype)
+    for i,label in enumerate(labels):
+        values[i]=np.round(series[label] if label in series else 50+slow_wave(5,365)+rng.normal(0,1,N),1)
+    values[rng.random(values.shape)<nan_fraction]=np.nan
+    info_labels=[key for key,_ in info_columns_id]
+    info_columns=[]
+    for i,label in enumerate(info_labels):
+        vocabulary=['']*len(mock_activities)+mock_activities if i==0 else ['']*3*len(mock_notes)+mock_notes
+        info_columns.append(random_text(rng,vocabulary,N))
+    return dataset(dates,labels,values,info_labels,info_columns)
+
+def random_text(rng,vocabulary,N):
+    """
+    Output: text_column of N entries drawn from vocabulary, gathered as bytes without creating a string per entry
+    """
+    return text_column.from_strings(vocabulary).take(rng.integers(0,len(vocabulary),N))
+
+calendar_periods=('day','week','month','year')
+
+def calendar_period_start(dates,period):
+    """
+    Output: datetime64[D] array with the first day of the period (day, week starting on Monday, month or year) of each date
+    """
+    dates=to_datetime64(dates)
+    if period=='week':
+        #day 0 (1970-01-01) was a Thursday
+        return dates-(dates.astype(np.int64)+3)%7
+    return dates.astype(f"datetime64[{ {'day':'D','month':'M','year':'Y'}[period]}]").astype('datetime64[D]')
+
+class calendar_aggregate:
+    """
+    Metrics of a dataset aggregated per calendar period (day, week starting on Monday, month or year) into the mean,
+    minimum, maximum and count of the finite values. The rows are sorted by date, so every period is a contiguous
+    group of rows and each statistic is a single reduceat over the group starts. Periods without rows are left out
+    (gaps stay gaps), periods without finite values of a metric have NaN statistics and a count of 0.
+    """
+    def __init__(self,data,period):
+        """
+        Inputs:
+        data: dataset
+        period: 'day', 'week', 'month' or 'year'
+        """
+        if period not in calendar_periods:
+            raise ValueError(f"Unknown period: {period}")
+        self.source=data
+        self.period=period
+        period_starts=calendar_period_start(data.dates,period)
+        N=len(data)
+        row_starts=np.concatenate(([0],np.flatnonzero(period_starts[1:]!=period_starts[:-1])+1)) if N else np.zeros(0,dtype=np.int64)
+        #row_starts[i]:row_starts[i+1] are the rows of period i
+        self.row_starts=np.append(row_starts,N)
+        values=data.values
+        if N:
+            finite=np.isfinite(values)
+            self.count=np.add.reduceat(finite,row_starts,axis=1,dtype=np.int64)
+            sums=np.add.reduceat(np.where(finite,values,0),row_starts,axis=1)
+            self.minimum=np.fmin.reduceat(values,row_starts,axis=1)
+            self.maximum=np.fmax.reduceat(values,row_starts,axis=1)
+        else:
+            self.count=np.zeros(values.shape,dtype=np.int64)
+            sums=self.minimum=self.maximum=np.zeros(values.shape,dtype=values.dtype)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            mean=(sums/self.count).astype(values.dtype,copy=False)
+        #the means form a dataset with one row per period, its elapsed days keep the origin of the source
+        self.data=dataset(period_starts[row_starts],data.labels,mean,origin=data.index.origin)
+        self.data.index.period_starts=True
+    def __len__(self):
+        return len(self.data)
+    def label(self,index):
+        """
+        Output: description of a period, e.g. 2024,03 for a month
+        """
+        date_str=self.data.date_str(index)
+        match self.period:
+            case 'week':
+                return f"Week from {date_str}"
+            case 'month':
+                return date_str[:7]
+            case 'year':
+                return date_str[:4]
+        return date_str
+    def info(self,label,index):
+        """
+        Output: the non-empty entries of an info column within a period, separated by '; '
+        """
+        entries=(self.source.info(label,row) for row in range(self.row_starts[index],self.row_starts[index+1]))
+        return '; '.join(entry for entry in entries if entry)
+
+class decimation_pyramid:
+    """
+    Min/max decimation levels of a series with increasing x-values, level k holds the indices of the minimum
+    and maximum of each bin of 2**k samples so that peaks survive downsampling
+    """
+    def __init__(self,x,y):
+        """
+        Inputs:
+        x: numpy array with increasing x-values
+        y: numpy array with y-values, NaN-values are ignored unless a whole bin is NaN
+        """
+        self.x=np.asarray(x,dtype=float)
+        self.y=np.asarray(y,dtype=float)
+        index_dtype=np.int32 if len(self.y)<2**31 else np.int64
+        indices=np.arange(len(self.y),dtype=index_dtype)
+        self.levels=[(indices,indices)]
+        while len(self.levels[-1][0])>1:
+            min_indices,max_indices=self.levels[-1]
+            self.levels.append((self.reduce_pairs(min_indices,np.less),self.reduce_pairs(max_indices,np.greater)))
+    def extend(self,x,y,start_index):
+        """
+        Update the levels after samples were appended to the series or changed from start_index on, each level is
+        recomputed from the first bin containing a changed sample, so the cost depends on the number of changed samples
+
+        Inputs:
+        x,y: numpy arrays with the whole updated series
+        start_index: first changed sample
+        """
+        self.x=np.asarray(x,dtype=float)
+        self.y=np.asarray(y,dtype=float)
+        indices=self.levels[0][0]
+        indices=extended(indices,np.arange(len(indices),len(self.y),dtype=indices.dtype))
+        self.levels[0]=(indices,indices)
+        first=start_index
+        level=1
+        while len(self.levels[level-1][0])>1:
+            min_indices,max_indices=self.levels[level-1]
+            if level<len(self.levels):
+                first>>=1
+                old_min_indices,old_max_indices=self.levels[level]
+                self.levels[level]=(extended(old_min_indices[:first],self.reduce_pairs(min_indices[2*first:],np.less)),
+                                    extended(old_max_indices[:first],self.reduce_pairs(max_indices[2*first:],np.greater)))
+            else:
+                self.levels.append((self.reduce_pairs(min_indices,np.less),self.reduce_pairs(max_indices,np.greater)))
+            level+=1
+        del self.levels[level:]
+    def reduce_pairs(self,indices,compare):
+        """
+        Combine neighbouring bins, keeping the index whose y-value wins compare (NaN-values never win)
+        """
+        first,second=indices[0:len(indices)-1:2],indices[1::2]
+        first_values,second_values=self.y[first],self.y[second]
+        reduced=np.where(compare(second_values,first_values)|np.isnan(first_values),second,first)
+        if len(indices)%2:
+            reduced=np.append(reduced,indices[-1])
+        return reduced
+    def get_data(self,x_start,x_end,max_points):
+        """
+        Downsampled data covering an x-range
+
+        Inputs:
+        x_start,x_end: x-range to cover, one sample outside the range is included on each side
+        max_points: maximum number of points to return (approximately, at least 2 per bin are kept)
 
-def moving_average(data,window):
+        Outputs: x- and y-values from the finest level that fits within max_points, the first and last samples are
+                 always included so that the data spans the full x-range (e.g. for auto-ranging)
+        """
+        N=len(self.x)
+        start_index=max(int(np.searchsorted(self.x,x_start,side='left'))-1,0)
+        end_index=min(int(np.searchsorted(self.x,x_end,side='right'))+1,N)
+        level=0
+        while level<len(self.levels)-1 and 2*((end_index-start_index)>>level)>max_points:
+            level+=1
+        if level==0:
+            if start_index==0 and end_index==N:
+                return self.x,self.y
+            indices=np.arange(start_index,end_index)
+        else:
+            min_indices,max_indices=self.levels[level]
+            bin_start,bin_end=start_index>>level,(end_index>>level)+1
+            min_indices,max_indices=min_indices[bin_start:bin_end],max_indices[bin_start:bin_end]
+            #keep the minimum and maximum of each bin in chronological order
+            indices=np.empty(2*len(min_indices),dtype=np.int64)
+            indices[0::2]=np.minimum(min_indices,max_indices)
+            indices[1::2]=np.maximum(min_indices,max_indices)
+        if len(indices)==0:
+            return self.x[:0],self.y[:0]
+        indices=np.concatenate(([0] if indices[0]>0 else [],indices,[N-1] if indices[-1]<N-1 else [])).astype(np.int64)
+        return self.x[indices],self.y[indices]
+
+class point_index:
+    """
+    Grid index of 2-D points for nearest-point queries, e.g. hover and click picking in a scatter plot. The extent of
+    the points is divided into about one cell per two points, the points are sorted by cell so that the points of a
+    row of neighbouring cells are one contiguous slice, and a query only checks the cells around the queried position.
+    Distances are measured after scaling each axis (e.g. to pixels), so the index is reused when the plot is zoomed.
+    """
+    def __init__(self,x,y):
+        """
+        Inputs:
+        x,y: numpy arrays with the coordinates, points with a non-finite coordinate are left out
+        """
+        x=np.asarray(x,dtype=float)
+        y=np.asarray(y,dtype=float)
+        self.length=len(x)
+        positions=np.flatnonzero(np.isfinite(x)&np.isfinite(y))
+        N=len(positions)
+        self.grid_size=max(int(np.sqrt(N/2)),1)
+        if N:
+            self.origin=np.array([x[positions].min(),y[positions].min()])
+            extent=np.array([x[positions].max(),y[positions].max()])-self.origin
+        else:
+            self.origin=extent=np.zeros(2)
+        #empty extents (e.g. a constant series) get cells of size 1
+        self.cell_size=np.where(extent>0,extent/self.grid_size,1.0)
+        cells=self.cell_of(x[positions],y[positions])
+        cell_ids=cells[0]*self.grid_size+cells[1]
+        order=np.argsort(cell_ids,kind='stable')
+        self.positions=positions[order]
+        self.x=x[self.positions]
+        self.y=y[self.positions]
+        #the points of cell k are self.positions[cell_starts[k]:cell_starts[k+1]]
+        self.cell_starts=np.searchsorted(cell_ids[order],np.arange(self.grid_size**2+1))
+    def __len__(self):
+        return self.length
+    def cell_of(self,x,y):
+        """
+        Output: column and row of the cells containing positions, positions outside the extent give the nearest cell
+        """
+        cells=[np.floor((coordinate-self.origin[axis])/self.cell_size[axis]) for axis,coordinate in enumerate((x,y))]
+        return [np.clip(np.nan_to_num(cell),0,self.grid_size-1).astype(np.int64) for cell in cells]
+    def nearest(self,x,y,scale_x=1.0,scale_y=1.0,max_distance=np.inf):
+        """
+        Inputs:
+        x,y: queried position
+        scale_x,scale_y: factors converting x- and y-differences to distances, e.g. pixels per unit
+        max_distance: points further away are not found
+
+        Outputs: (position in x and y of the nearest point, its scaled distance), None if no point is in reach
+        """
+        if len(self.positions)==0:
+            return None
+        column,row=(int(cell) for cell in self.cell_of(x,y))
+        #points in cells more than radius cells away from the queried cell are at least radius-1 cells away
+        cell_distance=min(self.cell_size[0]*scale_x,self.cell_size[1]*scale_y)
+        radius=1
+        while True:
+            first_column,last_column=max(column-radius,0),min(column+radius,self.grid_size-1)
+            first_row,last_row=max(row-radius,0),min(row+radius,self.grid_size-1)
+            columns=np.arange(first_column,last_column+1)
+            starts=self.cell_starts[columns*self.grid_size+first_row]
+            lengths=self.cell_starts[columns*self.grid_size+last_row+1]-starts
+            offsets=np.cumsum(lengths)-lengths
+            candidates=np.repeat(starts-offsets,lengths)+np.arange(lengths.sum())
+            if len(candidates):
+                distances=np.hypot((self.x[candidates]-x)*scale_x,(self.y[candidates]-y)*scale_y)
+                best=int(np.argmin(distances))
+                distance=float(distances[best])
+            else:
+                distance=np.inf
+            covers_grid=first_column==0 and first_row==0 and last_column==last_row==self.grid_size-1
+            bound=radius*cell_distance
+            if covers_grid or distance<=bound or bound>max_distance:
+                break
+            radius*=2
+        if distance>max_distance:
+            return None
+        return int(self.positions[candidates[best]]),distance
+
+@timed('moving_average')
+def moving_average(data,window,start_index=0):
     """
-    Moving average calculation
+    Moving average calculation, non-finite values are skipped when averaging and NaN-entries are kept as NaN.
+    Window sums are taken as differences of cumulative sums, so the cost is independent of the window size.
 
     Inputs:
     data: iterable containing data values
     window: size of moving average window
+    start_index: first index to compute, e.g. moving_average_changed_from after appending data
     
-    Output: numpy array with moving average values
+    Output: numpy array with the moving average values from start_index on
     """
-    moving_average_data=[]
-    half_window=window//2
+    data=np.asarray(data,dtype=float)
     N=len(data)
-    for i in range(N):
-        start_index=np.max([0,i-half_window])
-        if np.isnan(data[i]):
-            moving_average_data.append(np.nan)
+    start_indices,end_indices=moving_average_bounds(np.arange(start_index,N),N,window)
+    #only the data the windows reach into is summed
+    offset=int(start_indices[0]) if len(start_indices) else start_index
+    data_slice=data[offset:]
+    finite=np.isfinite(data_slice)
+    cumulative_sum=np.concatenate(([0.0],np.cumsum(np.where(finite,data_slice,0.0))))
+    cumulative_count=np.concatenate(([0],np.cumsum(finite)))
+    window_sum=cumulative_sum[end_indices-offset]-cumulative_sum[start_indices-offset]
+    window_count=cumulative_count[end_indices-offset]-cumulative_count[start_indices-offset]
+    moving_average_data=np.full(N-start_index,np.nan)
+    valid=(window_count>0)&~np.isnan(data[start_index:])
+    moving_average_data[valid]=window_sum[valid]/window_count[valid]
+    return moving_average_data
+
+def moving_average_changed_from(N,window):
+    """
+    Output: first index whose moving average can change when data is appended to a series of length N
+    """
+    #windows near the end are capped at the second to last index, so up to a window before the end depends on the length
+    return max(0,N-window-1)
+
+def moving_average_bounds(indices,N,window):
+    """
+    Slice bounds of the moving average windows used by moving_average
+
+    Inputs:
+    indices: numpy array with the indices to get the windows for
+    N: length of the data
+    window: size of moving average window
+
+    Outputs: numpy arrays with the start indices and (exclusive) end indices of the windows
+    """
+    start_indices=np.maximum(0,indices-window//2)
+    #windows touching the start are made symmetric around the current index, others are capped at the second to last index
+    end_indices=np.where(start_indices==0,np.maximum(1,indices*2),np.minimum(N-1,start_indices+window))
+    end_indices=np.clip(end_indices,start_indices,N)
+    return start_indices,end_indices
+
+class moving_average_cache(Mapping):
+    """
+    Read-only dictionary-like view of the moving averages of the metrics of a dataset for the current window.
+    Moving averages are computed when a metric is first accessed and kept in an LRU cache keyed by
+    (metric, window), so switching between recently used windows or metrics is a lookup.
+    Common windows can be precomputed on a thread pool with precompute, windows that are not precomputed
+    are computed on access.
+    """
+    def __init__(self,data,window=7,maxsize=32):
+        """
+        Inputs:
+        data: dataset
+        window: size of moving average window
+        maxsize: maximum number of moving averages to keep
+        """
+        self.data=data
+        self.data_dict=data.data_dict
+        self.window=window
+        self.maxsize=maxsize
+        self.cache=OrderedDict()
+        #keys=metrics, values=dictionary with keys=windows, values=rows of a 2-D array
+        self.precomputed={}
+    def set_window(self,window):
+        self.window=window
+    def cache_key(self,key):
+        """
+        Output: the (metric, window) key of the moving average currently returned for key
+        """
+        return (key,self.window)
+    def precompute(self,windows,executor=None):
+        """
+        Compute the moving averages of all metrics for several windows in the background
+
+        Inputs:
+        windows: iterable with the window sizes to precompute
+        executor: concurrent.futures.Executor to run on, None to use a new thread pool with one thread per metric (up to the CPU count)
+
+        Output: list with one future per metric
+        """
+        windows=sorted(set(windows))
+        own_executor=executor is None
+        if own_executor:
+            executor=ThreadPoolExecutor(max_workers=max(1,min(len(self.data_dict),os.cpu_count() or 1)))
+        futures=[executor.submit(self.precompute_metric,key,windows) for key in self.data_dict.keys()]
+        if own_executor:
+            executor.shutdown(wait=False)
+        return futures
+    def precompute_metric(self,key,windows):
+        """
+        Compute the moving averages of one metric for several windows into the rows of a 2-D array
+        """
+        data=self.data_dict[key]
+        matrix=np.empty((len(windows),len(data)))
+        for row,window in enumerate(windows):
+            matrix[row]=moving_average(data,window)
+        matrix.flags.writeable=False
+        #the rows are stored as views created once, so their identity is stable for caches keyed by id
+        self.precomputed[key]={window:matrix[row] for row,window in enumerate(windows)}
+    def get_precomputed(self,key):
+        """
+        Output: precomputed moving average of key for the current window, None if it is not available (yet)
+        """
+        values=self.precomputed.get(key,{}).get(self.window)
+        #precomputation started before rows were appended yields shorter series
+        if values is None or len(values)!=len(self.data):
+            return None
+        return values
+    def extend(self,old_N):
+        """
+        Update the kept moving averages after rows were appended to the dataset (of old_N rows before), only the
+        tail from moving_average_changed_from on is recomputed and written into spare capacity (see extended)
+        """
+        self.data_dict=self.data.data_dict
+        for cache_key,values in list(self.cache.items()):
+            key,window=cache_key
+            if len(values)==old_N:
+                self.cache[cache_key]=self.extended_average(key,values,window)
+        for key,rows in list(self.precomputed.items()):
+            self.precomputed[key]={window:self.extended_average(key,values,window) for window,values in rows.items() if len(values)==old_N}
+    def extended_average(self,key,values,window):
+        start_index=moving_average_changed_from(len(values),window)
+        values=extended(values[:start_index],moving_average(self.data_dict[key],window,start_index))
+        values.flags.writeable=False
+        return values
+    def __getitem__(self,key):
+        precomputed=self.get_precomputed(key)
+        if precomputed is not None:
+            return precomputed
+        cache_key=self.cache_key(key)
+        if cache_key in self.cache:
+            self.cache.move_to_end(cache_key)
         else:
-            if start_index==0:
-                end_index=np.max([1,i*2])
+            self.cache[cache_key]=moving_average(self.data_dict[key],self.window)
+            self.cache[cache_key].flags.writeable=False
+            if len(self.cache)>self.maxsize:
+                self.cache.popitem(last=False)
+        return self.cache[cache_key]
+    def value_at(self,key,index):
+        """
+        Moving average at a single index, computed from the window slice unless the whole series is cached
+        """
+        precomputed=self.get_precomputed(key)
+        if precomputed is not None:
+            return precomputed[index]
+        cache_key=self.cache_key(key)
+        if cache_key in self.cache:
+            return self.cache[cache_key][index]
+        data=self.data_dict[key]
+        if np.isnan(data[index]):
+            return np.nan
+        start_index,end_index=moving_average_bounds(np.array([index]),len(data),self.window)
+        data_slice=np.asarray(data[start_index[0]:end_index[0]],dtype=float)
+        data_slice=data_slice[np.isfinite(data_slice)]
+        return np.mean(data_slice) if len(data_slice) else np.nan
+    def __contains__(self,key):
+        return key in self.data_dict
+    def __iter__(self):
+        return iter(self.data_dict)
+    def __len__(self):
+        return len(self.data_dict)
+
+class range_statistics:
+    """
+    Statistics of the rows of a 2-D array (e.g. one row per metric) over a row range start:end: pairwise correlations,
+    least-squares fits and rolling variance, each computed on the rows where both values are finite.
+    The pairwise sums (counts, sums, sums of squares and products) are computed with matrix products and kept per
+    range in an LRU cache. When the range endpoints move, the sums of the previous range are updated with the rows
+    entering or leaving the range, so dragging an endpoint costs the number of rows it moved over.
+    """
+    def __init__(self,values,maxsize=32):
+        """
+        Inputs:
+        values: 2-D array-like with one row per variable, non-finite entries are treated as missing
+        maxsize: maximum number of ranges to keep the sums of
+        """
+        values=np.atleast_2d(np.asarray(values,dtype=float))
+        finite=np.isfinite(values)
+        #values are shifted by their means to limit cancellation in the sums of squares
+        counts=finite.sum(axis=1)
+        self.center=np.where(counts>0,np.where(finite,values,0.0).sum(axis=1)/np.maximum(counts,1),0.0)
+        self.values=np.where(finite,values-self.center[:,None],0.0)
+        self.finite=finite.astype(float)
+        self.maxsize=maxsize
+        self.cache=OrderedDict()
+        self.last=None
+        self.rolling_cache={}
+    def __len__(self):
+        return self.values.shape[1]
+    def range_sums(self,start,end):
+        """
+        Output: array of shape (4,M,M) with the sums over the rows start:end where variables i and j are both finite of
+                1, value_i, value_i**2 and value_i*value_j (at [k,i,j])
+        """
+        values=self.values[:,start:end]
+        finite=self.finite[:,start:end]
+        return np.stack((finite@finite.T,values@finite.T,(values*values)@finite.T,values@values.T))
+    def signed_sums(self,start,end):
+        """
+        Output: range_sums for start<end, the negated range_sums of end:start otherwise
+        """
+        if start<=end:
+            return self.range_sums(start,end)
+        return -self.range_sums(end,start)
+    def sums(self,start,end):
+        """
+        Output: range_sums(start,end), taken from the cache or updated from the previously requested range
+        """
+        N=len(self)
+        start,end=min(max(start,0),N),min(max(end,start,0),N)
+        key=(start,end)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            sums=self.cache[key]
+        else:
+            previous=self.last
+            if previous is not None and abs(start-previous[0])+abs(end-previous[1])<end-start:
+                sums=previous[2]+self.signed_sums(start,previous[0])+self.signed_sums(previous[1],end)
             else:
-                end_index=np.min([N-1,start_index+window])
-            data_slice=data[start_index:end_index]
-            data_slice_finite=[d for d in data_slice if np.isfinite(d)]
-            try:
-                moving_average_data.append(np.mean(data_slice_finite))
-            except:
-                moving_average_data.append(np.nan)
-    return np.array(moving_average_data)
+                sums=self.range_sums(start,end)
+            self.cache[key]=sums
+            if len(self.cache)>self.maxsize:
+                self.cache.popitem(last=False)
+        self.last=(start,end,sums)
+        return sums
+    def moments(self,start,end):
+        """
+        Output: pairwise counts, means and variances of variable i (at [i,j]) and covariances, numpy arrays of shape (M,M)
+        """
+        count,total,squares,products=self.sums(start,end)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            mean=total/count
+            variance=np.maximum(squares/count-mean**2,0.0)
+            covariance=products/count-mean*mean.T
+        return count,mean,variance,covariance
+    def correlation_matrix(self,start,end):
+        """
+        Output: numpy array of shape (M,M) with the Pearson correlation coefficients of the variables over start:end,
+                NaN for pairs with fewer than two rows or zero variance
+        """
+        count,_,variance,covariance=self.moments(start,end)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            correlation=np.clip(covariance/np.sqrt(variance*variance.T),-1.0,1.0)
+        correlation[(count<2)|(variance==0)|(variance.T==0)]=np.nan
+        return correlation
+    def linear_fit(self,start,end,x=0,y=1):
+        """
+        Least-squares fit of variable y against variable x over start:end
+
+        Output: dictionary with slope, intercept, r (correlation coefficient) and count, slope, intercept and r are NaN
+                for fewer than two rows or constant x
+        """
+        count,mean,variance,covariance=self.moments(start,end)
+        count=int(count[x,y])
+        if count<2 or variance[x,y]==0:
+            return {'slope':np.nan,'intercept':np.nan,'r':np.nan,'count':count}
+        slope=covariance[x,y]/variance[x,y]
+        intercept=mean[y,x]+self.center[y]-slope*(mean[x,y]+self.center[x])
+        r=covariance[x,y]/np.sqrt(variance[x,y]*variance[y,x]) if variance[y,x]>0 else np.nan
+        return {'slope':float(slope),'intercept':float(intercept),'r':float(np.clip(r,-1.0,1.0)),'count':count}
+    def rolling_variance(self,start,end,row=0,window=7):
+        """
+        Variance of a variable in moving windows (the windows of moving_average) over start:end, the whole series
+        is computed once per row and window, so moving the range endpoints is a slice
 
-def recursive_parse(str_to_parse,data_formula_map_dict,data_dict,days):
+        Output: numpy array with the variances, NaN where a window has fewer than two finite values or the value is missing
+        """
+        key=(row,window)
+        if key not in self.rolling_cache:
+            self.rolling_cache[key]=rolling_variance(self.values[row],window,self.finite[row].astype(bool))
+        return self.rolling_cache[key][start:end]
+
+def rolling_variance(data,window,finite=None):
     """
-    Evaluate a string-input formula to numerical values, recursive calls will be made whenever a ( symbol
-    is encountered. Supported formula operations are: +, -, *, /
+    Variance in the moving windows of moving_average, non-finite values are skipped and NaN-entries are kept as NaN.
+    Window sums are taken as differences of cumulative sums, so the cost is independent of the window size.
 
     Inputs:
-    str_to_parse: formula string to evaluate
-    data_formula_map_dict: dictionary with keys=data symbol, values=data label/ID in data_dict
-    data_dict: dictionary with keys=data label/ID in data_dict, values=data corresponding to the data label
-    days: numpy array with day count
+    data: iterable containing data values
+    window: size of moving window
+    finite: boolean numpy array marking the finite values, None to derive it from data
 
-    Outputs:
-    result: numerical values of the evaluated formula
-    iter: count of how many characters that were recursively evaluated (the function call that issued the 
-          recursive call should skip ahead this many characters for subsequent evaluation)
-    """
-    operators={'*','+','-','/'}
-    str_to_parse.replace(' ','')
-    temp=''
-    is_number=False
-    to_evaluate=[]
-    to_operate=[]
+    Output: numpy array with the (population) variances
+    """
+    data=np.asarray(data,dtype=float)
+    N=len(data)
+    if finite is None:
+        finite=np.isfinite(data)
+    data=np.where(finite,data,0.0)
+    start_indices,end_indices=moving_average_bounds(np.arange(N),N,window)
+    cumulative_sum=np.concatenate(([0.0],np.cumsum(data)))
+    cumulative_squares=np.concatenate(([0.0],np.cumsum(data*data)))
+    cumulative_count=np.concatenate(([0],np.cumsum(finite)))
+    window_count=cumulative_count[end_indices]-cumulative_count[start_indices]
+    variance=np.full(N,np.nan)
+    valid=(window_count>1)&finite
+    count=window_count[valid]
+    mean=(cumulative_sum[end_indices]-cumulative_sum[start_indices])[valid]/count
+    variance[valid]=np.maximum((cumulative_squares[end_indices]-cumulative_squares[start_indices])[valid]/count-mean**2,0.0)
+    return variance
+
+formula_operators={'+':np.add,'-':np.subtract,'*':np.multiply,'/':np.divide}
+
+@timed('formula_parse')
+@lru_cache(maxsize=128)
+def compile_formula(formula):
+    """
+    Compile a string-input formula into a postfix program, compiled programs are memoized by formula text.
+    Supported formula operations are: +, -, *, / and parentheses, numbers may contain a decimal point and
+    every other non-space character is treated as a data symbol
+
+    Inputs:
+    formula: formula string to compile
+
+    Output: tuple of (kind,value)-instructions where kind is 'number', 'symbol', 'negate' or 'operator'
+    """
+    tokens=[]
     iter=0
-    while iter<len(str_to_parse):
-        ch=str_to_parse[iter]
+    while iter<len(formula):
+        ch=formula[iter]
+        if ch.isnumeric() or ch=='.':
+            number_start=iter
+            while iter<len(formula) and (formula[iter].isnumeric() or formula[iter]=='.'):
+                iter+=1
+            tokens.append(('number',float(formula[number_start:iter])))
+            continue
+        if ch in formula_operators or ch in '()':
+            tokens.append((ch,ch))
+        elif not ch.isspace():
+            tokens.append(('symbol',ch))
         iter+=1
-        if ch=='(':
-            rec_result,rec_iter=recursive_parse(str_to_parse[iter:],data_formula_map_dict,data_dict,days)
-            to_evaluate.append(rec_result)
-            iter+=rec_iter
-        elif ch==')':
-            break
-        elif ch.isnumeric():
-            temp+=ch
-            is_number=True
-        elif ch in operators:
-            if is_number:
-                to_evaluate.append(float(temp))
-                is_number=False
-            temp=''
-            to_operate.append(ch)
+    program=[]
+    position=0
+    def peek():
+        return tokens[position][0] if position<len(tokens) else None
+    def parse_expression():
+        nonlocal position
+        parse_term()
+        while peek() in ('+','-'):
+            operator=tokens[position][1]
+            position+=1
+            parse_term()
+            program.append(('operator',operator))
+    def parse_term():
+        nonlocal position
+        parse_factor()
+        while peek() in ('*','/'):
+            operator=tokens[position][1]
+            position+=1
+            parse_factor()
+            program.append(('operator',operator))
+    def parse_factor():
+        nonlocal position
+        kind=peek()
+        if kind=='-':
+            position+=1
+            parse_factor()
+            program.append(('negate',None))
+        elif kind=='(':
+            position+=1
+            parse_expression()
+            #a missing closing parenthesis at the end of the formula is accepted
+            if peek()==')':
+                position+=1
+        elif kind in ('number','symbol'):
+            program.append(tokens[position])
+            position+=1
         else:
-            data_symbol=data_formula_map_dict[ch]
-            if data_symbol in data_dict:
-                to_evaluate.append(data_dict[data_symbol])
+            raise ValueError(f"Invalid formula: {formula}")
+    parse_expression()
+    if position<len(tokens):
+        raise ValueError(f"Invalid formula: {formula}")
+    return tuple(program)
+
+_formula_result_cache=OrderedDict()
+_formula_result_cache_size=64
+
+@timed('formula')
+def evaluate_formula(formula,data_formula_map_dict,data_dict,days,start_index=0,end_index=None):
+    """
+    Evaluate a string-input formula to numerical values over the range start_index:end_index. Operands are
+    sliced before evaluation and intermediate results are updated in place. Results are cached per formula,
+    range and identity of the referenced data arrays, so replacing an array in data_dict invalidates its entries.
+
+    Inputs:
+    formula: formula string to evaluate, see compile_formula
+    data_formula_map_dict: dictionary with keys=data symbol, values=data label/ID in data_dict
+    data_dict: dictionary with keys=data label/ID in data_dict, values=data corresponding to the data label
+    days: numpy array with day count, used for symbols that are not in data_dict
+    start_index: first index of the range to evaluate
+    end_index: index after the last one of the range to evaluate, None evaluates until the end
+
+    Output: read-only numpy array with the numerical values of the evaluated formula
+    """
+    program=compile_formula(formula)
+    source_arrays={}
+    for kind,symbol in program:
+        if kind=='symbol' and symbol not in source_arrays:
+            data_label=data_formula_map_dict[symbol]
+            source_arrays[symbol]=data_dict[data_label] if data_label in data_dict else days
+    cache_key=(formula,start_index,end_index,tuple((symbol,id(array)) for symbol,array in source_arrays.items()),id(days))
+    if cache_key in _formula_result_cache:
+        _formula_result_cache.move_to_end(cache_key)
+        return _formula_result_cache[cache_key][1]
+    operands={symbol:array[start_index:end_index] for symbol,array in source_arrays.items()}
+    stack=[]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        for kind,value in program:
+            if kind=='number':
+                stack.append((value,False))
+            elif kind=='symbol':
+                stack.append((operands[value],False))
+            elif kind=='negate':
+                operand,owned=stack.pop()
+                if owned:
+                    stack.append((np.negative(operand,out=operand),True))
+                else:
+                    stack.append((np.negative(operand),isinstance(operand,np.ndarray)))
             else:
-                to_evaluate.append(days)
-    if temp!='':
-        to_evaluate.append(float(temp))
-    to_add_subtract=[to_evaluate[0]]
-    add_subtract_operators=[]
-    for i,operator in enumerate(to_operate,start=1):
-        if operator=='*':
-            to_add_subtract[-1]=to_add_subtract[-1]*to_evaluate[i]
-        elif operator=='/':
-            to_add_subtract[-1]=to_add_subtract[-1]/to_evaluate[i]
-        else:
-            to_add_subtract.append(to_evaluate[i])
-            add_subtract_operators.append(operator)
-    result=to_add_subtract[0]
-    for operator,operand in zip(add_subtract_operators,to_add_subtract[1:]):
-        if operator=='-':
-            result-=operand
-        else:
-            result+=operand
-    return result,iter
\ No newline at end of file
+                right,right_owned=stack.pop()
+                left,left_owned=stack.pop()
+                ufunc=formula_operators[value]
+                #reuse temporaries from earlier operations as output buffers
+                if left_owned:
+                    stack.append((ufunc(left,right,out=left),True))
+                elif right_owned:
+                    stack.append((ufunc(left,right,out=right),True))
+                else:
+                    result=ufunc(left,right)
+                    stack.append((result,isinstance(result,np.ndarray)))
+    result=stack[0][0]
+    if not isinstance(result,np.ndarray) or result.ndim==0:
+        result=np.full(len(days[start_index:end_index]),float(result))
+    else:
+        result=result.view()
+    result.flags.writeable=False
+    #the cache keeps the source arrays alive so that their ids can not be reused while cached
+    _formula_result_cache[cache_key]=((tuple(source_arrays.values()),days),result)
+    if len(_formula_result_cache)>_formula_result_cache_size:
+        _formula_result_cache.popitem(last=False)
+    return result
@@ -0,0 +1,220 @@
+"""
+Benchmarks of the hot paths (sheet parsing, moving averages, calendar resampling, formula evaluation and plot rebuilds) on synthetic data.
+Runs headless, results are written as JSON and can be compared against the results of an earlier commit:
+
+python benchmark.py --output before.json
+python benchmark.py --compare before.json
+"""
+import os
+os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+import numpy as np
+
+import backend
+from backend import data_columns_id, local_worksheet, fetch_columns, parse_columns, moving_average, evaluate_formula, generate_data, moving_average_cache, calendar_aggregate
+
+def synthetic_data(N,seed=0):
+    """
+    Output: dataset with N rows spread over at most about 100 years, i.e. several rows per day for large N
+    """
+    return generate_data(N,seed,max_entries_per_day=max(1,-(-2*N//36500)))
+
+class benchmark_case:
+    """
+    One benchmark: setup builds the state for a row count (not timed), run is timed, reset is called before each run
+    """
+    def __init__(self,name,setup,run,reset=None,max_rows=None):
+        self.name=name
+        self.setup=setup
+        self.run=run
+        self.reset=reset
+        self.max_rows=max_rows
+
+def setup_parse(N):
+    worksheet=local_worksheet.from_dataset(synthetic_data(N))
+    return {'worksheet':worksheet}
+
+def run_parse(state):
+    _,columns=fetch_columns(state['worksheet'])
+    parse_columns(columns)
+
+def setup_numeric(N):
+    data=synthetic_data(N)
+    data_formula_map_dict={chr(65+i):label for i,label in enumerate(data.labels+['Days'])}
+    return {'data':data,'data_formula_map_dict':data_formula_map_dict}
+
+def run_moving_average(window):
+    def run(state):
+        moving_average(state['data'].data_dict[data_columns_id[0][0]],window)
+    return run
+
+def run_moving_average_cache(state):
+    moving_average_dict=moving_average_cache(state['data'])
+    for future in moving_average_dict.precompute((7,14,30,90)):
+        future.result()
+
+def run_resample(period):
+    def run(state):
+        calendar_aggregate(state['data'],period)
+    return run
+
+def run_formula(state):
+    data=state['data']
+    evaluate_formula('(A-B*2)/C+F',state['data_formula_map_dict'],data.data_dict,data.day_numbers)
+
+def reset_formula(state):
+    backend._formula_result_cache.clear()
+
+def setup_gui(N):
+    from PyQt6.QtWidgets import QApplication
+    import main
+    app=QApplication.instance() or QApplication([])
+    state=setup_numeric(N)
+    state['app']=app
+    state['moving_average_dict']=moving_average_cache(state['data'])
+    state['history']=main.chronological_plotter(state['data'],state['moving_average_dict'])
+    state['history'].resize(1200,700)
+    state['comparison']=main.data_analysis_plotter(state['data'],state['moving_average_dict'])
+    state['comparison'].resize(1200,700)
+    state['labels']=state['data'].labels
+    state['run_count']=0
+    return state
+
+def reset_gui(state):
+    #plot rebuilds include building the decimation pyramids and moving averages of the newly selected data
+    state['history'].pyramids.clear()
+    state['moving_average_dict'].cache.clear()
+    state['run_count']+=1
+
+def run_history_rebuild(state):
+    history=state['history']
+    label=state['labels'][state['run_count']%len(state['labels'])]
+    history.change_y_data(label,history.left_right_dict[history.left_y_data_picker])
+    #the widget is not shown, so the deferred redraw is applied directly
+    history.apply_changes()
+    history.grab()
+
+def run_comparison_rebuild(state):
+    comparison=state['comparison']
+    labels=state['labels']
+    comparison.scatter_dict['x_label']=labels[state['run_count']%len(labels)]
+    comparison.scatter_dict['y_label']=labels[(state['run_count']+1)%len(labels)]
+    comparison.plot_data()
+    comparison.grab()
+
+benchmark_cases=[benchmark_case('fetch_parse',setup_parse,run_parse,max_rows=10**6),
+                 benchmark_case('moving_average_7',setup_numeric,run_moving_average(7)),
+                 benchmark_case('moving_average_90',setup_numeric,run_moving_average(90)),
+                 benchmark_case('moving_average_precompute',setup_numeric,run_moving_average_cache),
+                 benchmark_case('resample_week',setup_numeric,run_resample('week')),
+                 benchmark_case('resample_month',setup_numeric,run_resample('month')),
+                 benchmark_case('formula',setup_numeric,run_formula,reset_formula),
+                 benchmark_case('history_rebuild',setup_gui,run_history_rebuild,reset_gui,max_rows=10**6),
+                 benchmark_case('comparison_rebuild',setup_gui,run_comparison_rebuild,reset_gui,max_rows=10**6)]
+
+def time_case(case,state,repeats):
+    """
+    Output: list of the durations of repeats runs and the peak traced memory of one more run in bytes
+    """
+    durations=[]
+    for _ in range(repeats):
+        if case.reset:
+            case.reset(state)
+        start_time=time.perf_counter()
+        case.run(state)
+        durations.append(time.perf_counter()-start_time)
+    #memory is traced in a separate run, tracing slows down allocations
+    if case.reset:
+        case.reset(state)
+    tracemalloc.start()
+    case.run(state)
+    _,peak_memory=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return durations,peak_memory
+
+def run_benchmarks(sizes,names=None,repeats=5):
+    """
+    Inputs:
+    sizes: row counts to benchmark
+    names: names of the benchmarks to run, None for all
+    repeats: number of timed runs per benchmark and row count
+
+    Output: list of result dictionaries
+    """
+    results=[]
+    for case in benchmark_cases:
+        if names and case.name not in names:
+            continue
+        for N in sizes:
+            if case.max_rows and N>case.max_rows:
+                continue
+            state=case.setup(N)
+            durations,peak_memory=time_case(case,state,repeats)
+            result={'benchmark':case.name,'rows':N,'min_s':min(durations),'median_s':float(np.median(durations)),'peak_memory_bytes':peak_memory}
+            print(f"{case.name:28s}{N:>10d} rows {result['min_s']*1000:10.2f} ms {peak_memory/2**20:10.1f} MiB",flush=True)
+            results.append(result)
+            del state
+    return results
+
+def get_metadata():
+    try:
+        commit=subprocess.run(['git','rev-parse','--short','HEAD'],capture_output=True,text=True,cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit=''
+    return {'commit':commit,'time':time.strftime('%Y-%m-%dT%H:%M:%S'),'python':platform.python_version(),
+            'numpy':np.__version__,'platform':platform.platform(),'cpu_count':os.cpu_count()}
+
+def compare_results(results,baseline,max_slowdown=1.5,max_memory_growth=1.5,min_difference=0.001):
+    """
+    Compare results with the results of an earlier run
+
+    Inputs:
+    results, baseline: lists of result dictionaries, see run_benchmarks
+    max_slowdown: largest allowed ratio of the minimum durations
+    max_memory_growth: largest allowed ratio of the peak memory
+    min_difference: durations differing by less than this (in seconds) are not reported, they are within timer noise
+
+    Output: list of strings describing the regressions
+    """
+    baseline={(result['benchmark'],result['rows']):result for result in baseline}
+    regressions=[]
+    for result in results:
+        old=baseline.get((result['benchmark'],result['rows']))
+        if old is None:
+            continue
+        name=f"{result['benchmark']} ({result['rows']} rows)"
+        if result['min_s']>old['min_s']*max_slowdown and result['min_s']-old['min_s']>min_difference:
+            regressions.append(f"{name}: {old['min_s']*1000:.2f} ms -> {result['min_s']*1000:.2f} ms")
+        if result['peak_memory_bytes']>old['peak_memory_bytes']*max_memory_growth:
+            regressions.append(f"{name}: peak memory {old['peak_memory_bytes']/2**20:.1f} MiB -> {result['peak_memory_bytes']/2**20:.1f} MiB")
+    return regressions
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Benchmark the hot paths on synthetic data')
+    parser.add_argument('--sizes',default='1000,10000,100000,1000000,10000000',help='comma-separated row counts')
+    parser.add_argument('--benchmarks',default='',help='comma-separated benchmark names, all if empty: '+', '.join(case.name for case in benchmark_cases))
+    parser.add_argument('--repeats',type=int,default=5,help='timed runs per benchmark and row count, the minimum is compared')
+    parser.add_argument('--output',help='JSON file to write the results to')
+    parser.add_argument('--compare',help='JSON file with earlier results, exits with status 1 on regressions')
+    parser.add_argument('--max-slowdown',type=float,default=1.5,help='largest allowed duration ratio compared to the earlier results')
+    parser.add_argument('--max-memory-growth',type=float,default=1.5,help='largest allowed peak memory ratio compared to the earlier results')
+    args=parser.parse_args()
+    results=run_benchmarks([int(size) for size in args.sizes.split(',') if size.strip()],
+                           [name for name in args.benchmarks.split(',') if name.strip()],args.repeats)
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump({'metadata':get_metadata(),'results':results},f,indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline=json.load(f)['results']
+        regressions=compare_results(results,baseline,args.max_slowdown,args.max_memory_growth)
+        for regression in regressions:
+            print('Regression: '+regression)
+        if regressions:
+            sys.exit(1)
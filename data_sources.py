@@ -0,0 +1,377 @@
+import io
+import os
+import csv
+import sqlite3
+from itertools import islice
+import numpy as np
+
+from backend import get_data, generate_data, load_cached_data, format_dates, info_columns_id, text_column
+
+date_column_label='Date'
+info_labels=[key for key,_ in info_columns_id]
+
+def to_float(column):
+    """
+    Convert a sequence of cell strings to a float array, empty cells become NaN
+    """
+    return np.fromiter((float(cell) if cell.strip() else np.nan for cell in column),dtype=float,count=len(column))
+
+def sort_and_filter(dates,data_dict,info_columns_dict,start_date=None,end_date=None):
+    """
+    Sort rows chronologically and keep the rows within [start_date,end_date]
+
+    Inputs:
+    dates: datetime64 array
+    data_dict: dictionary with keys=data column descriptors, values=float arrays
+    info_columns_dict: dictionary with keys=info column descriptors, values=lists of strings or backend.text_column
+    start_date,end_date: strings of the form YYYY-MM-DD, None for no limit
+
+    Outputs: dates_formatted, data_dict, info_columns_dict as described in backend.get_data
+    """
+    dates=np.asarray(dates,dtype='datetime64[D]')
+    keep=np.ones(len(dates),dtype=bool)
+    if start_date is not None:
+        keep&=dates>=np.datetime64(start_date,'D')
+    if end_date is not None:
+        keep&=dates<=np.datetime64(end_date,'D')
+    if keep.all() and np.all(dates[1:]>=dates[:-1]):
+        return format_dates(dates),{key:np.asarray(values,dtype=float) for key,values in data_dict.items()},info_columns_dict
+    order=np.flatnonzero(keep)
+    order=order[np.argsort(dates[order],kind='stable')]
+    data_dict={key:np.asarray(values,dtype=float)[order] for key,values in data_dict.items()}
+    info_columns_dict={key:text_column.from_strings(values).take(order) for key,values in info_columns_dict.items()}
+    return format_dates(dates[order]),data_dict,info_columns_dict
+
+class data_source:
+    """
+    Base class of the data sources, load returns (dates_formatted, data_dict, info_columns_dict) as described in
+    backend.get_data. Local files have a Date column (YYYY-MM-DD), the columns named as in backend.info_columns_id
+    hold text and all other columns hold data values.
+    """
+    def load(self,start_date=None,end_date=None):
+        """
+        Inputs:
+        start_date,end_date: strings of the form YYYY-MM-DD limiting the loaded dates, None for no limit
+
+        Outputs: dates_formatted, data_dict, info_columns_dict as described in backend.get_data
+        """
+        raise NotImplementedError
+    def load_steps(self,start_date=None,end_date=None):
+        """
+        Output: list of (progress message, function) tuples for main.data_loader
+        """
+        return [(f"Loading {self.description}...",lambda:self.load(start_date,end_date))]
+    def load_new(self,last_date,last_date_rows,end_date=None):
+        """
+        Rows added since the last load, for polling. Only rows dated after the loaded ones (or further rows on the last
+        loaded date) count as new, edits of loaded rows are picked up by the next full load.
+
+        Inputs:
+        last_date: string of the form YYYY-MM-DD, the date of the last loaded row
+        last_date_rows: number of loaded rows dated last_date
+        end_date: as in load
+
+        Outputs: dates_formatted, data_dict, info_columns_dict of the new rows, None if there are none
+        """
+        return skip_rows(self.load(last_date,end_date),last_date_rows)
+
+def skip_rows(data,count):
+    """
+    Output: dates_formatted, data_dict, info_columns_dict without their first count rows, None if no rows are left
+    """
+    if data is None or len(data[0])<=count:
+        return None
+    dates_formatted,data_dict,info_columns_dict=data
+    return (dates_formatted[count:],{key:values[count:] for key,values in data_dict.items()},
+            {key:values[count:] for key,values in info_columns_dict.items()})
+
+class sheets_source(data_source):
+    """
+    Google Sheets, via the on-disk cache of backend.get_data
+    """
+    description='Google Sheets data'
+    def __init__(self,service_account_file='key.json',spreadsheet_id_file='spreadsheet_id.txt',cache_dir='cache',offline=False):
+        self.service_account_file=service_account_file
+        self.spreadsheet_id_file=spreadsheet_id_file
+        self.cache_dir=cache_dir
+        self.offline=offline
+    def load(self,start_date=None,end_date=None):
+        if self.offline:
+            data=load_cached_data(self.spreadsheet_id_file,self.cache_dir)
+        else:
+            data=get_data(self.service_account_file,self.spreadsheet_id_file,cache_dir=self.cache_dir)
+        return self.filter(data,start_date,end_date)
+    def filter(self,data,start_date,end_date):
+        if data is None or (start_date is None and end_date is None):
+            return data
+        dates_formatted,data_dict,info_columns_dict=data
+        dates=np.array([date_str.replace(',','-') for date_str in dates_formatted],dtype='datetime64[D]')
+        return sort_and_filter(dates,data_dict,info_columns_dict,start_date,end_date)
+    def load_steps(self,start_date=None,end_date=None):
+        steps=[('Loading cached data...',lambda:self.filter(load_cached_data(self.spreadsheet_id_file,self.cache_dir),start_date,end_date))]
+        if not self.offline:
+            steps.append(('Fetching data...',lambda:self.load(start_date,end_date)))
+        return steps
+    def load_new(self,last_date,last_date_rows,end_date=None):
+        """
+        Rows added since the last load as in data_source.load_new, only the entries of the dates changed by the cache
+        sync are read and filtered
+        """
+        if self.offline:
+            return super().load_new(last_date,last_date_rows,end_date)
+        data=get_data(self.service_account_file,self.spreadsheet_id_file,cache_dir=self.cache_dir,changes=True)
+        #the changed entries include every entry of their dates, if they start after last_date its rows are all loaded
+        if data[0] and data[0][0].replace(',','-')>last_date:
+            last_date_rows=0
+        return skip_rows(self.filter(data,last_date,end_date),last_date_rows)
+
+class mock_source(data_source):
+    """
+    Generated mock data, see backend.generate_data
+    """
+    description='mock data'
+    def __init__(self,rows=1844,seed=None,max_entries_per_day=1):
+        self.rows=rows
+        self.seed=seed
+        self.max_entries_per_day=max_entries_per_day
+    def load(self,start_date=None,end_date=None):
+        dates_formatted,data_dict,info_columns_dict=generate_data(self.rows,self.seed,max_entries_per_day=self.max_entries_per_day).to_columns()
+        if start_date is None and end_date is None:
+            return dates_formatted,data_dict,info_columns_dict
+        dates=np.array([date_str.replace(',','-') for date_str in dates_formatted],dtype='datetime64[D]')
+        return sort_and_filter(dates,data_dict,info_columns_dict,start_date,end_date)
+
+class csv_source(data_source):
+    """
+    Comma-separated file with a header row, read in chunks of chunk_rows rows so that rows outside the
+    requested date range are dropped while streaming. Polling reads the rows appended to the file since the last read.
+    """
+    def __init__(self,path,chunk_rows=100000):
+        self.path=path
+        self.chunk_rows=chunk_rows
+        self.description=os.path.basename(path)
+        self.header=None
+        #byte offset of the end of the last read, where polling continues
+        self.read_offset=None
+    def load(self,start_date=None,end_date=None):
+        with open(self.path,'rb') as binary_file:
+            f=io.TextIOWrapper(binary_file,encoding='utf-8',newline='')
+            reader=csv.reader(f)
+            header=next(reader)
+            data=self.read_rows(reader,header,start_date,end_date)
+            self.header=header
+            self.read_offset=binary_file.tell()
+        return data
+    def load_new(self,last_date,last_date_rows,end_date=None):
+        """
+        Rows appended to the file since the last read that are dated on or after last_date, the file is read in full
+        if it was not read before or has shrunk (files are expected to only be appended to)
+        """
+        if self.read_offset is None or os.path.getsize(self.path)<self.read_offset:
+            return super().load_new(last_date,last_date_rows,end_date)
+        with open(self.path,'rb') as f:
+            f.seek(self.read_offset)
+            appended=f.read()
+        #an incomplete last line is left for the next poll
+        appended=appended[:appended.rfind(b'\n')+1]
+        if not appended:
+            return None
+        reader=csv.reader(io.StringIO(appended.decode('utf-8'),newline=''))
+        data=self.read_rows(reader,self.header,last_date,end_date)
+        self.read_offset+=len(appended)
+        return data if data[0] else None
+    def read_rows(self,reader,header,start_date=None,end_date=None):
+        """
+        Read the rows of a csv.reader in chunks, see load
+
+        Inputs:
+        reader: csv.reader positioned after the header row
+        header: list of the column labels
+        start_date,end_date: as in load
+
+        Outputs: dates_formatted, data_dict, info_columns_dict as described in backend.get_data
+        """
+        date_position=header.index(date_column_label)
+        data_positions=[(label,i) for i,label in enumerate(header) if i!=date_position and label not in info_labels]
+        info_positions=[(label,i) for i,label in enumerate(header) if label in info_labels]
+        date_chunks=[]
+        data_chunks={label:[] for label,_ in data_positions}
+        info_columns_dict={label:[] for label,_ in info_positions}
+        while True:
+            rows=list(islice(reader,self.chunk_rows))
+            if not rows:
+                break
+            #pad short rows so that every row has a cell per header column
+            rows=[row+['']*(len(header)-len(row)) if len(row)<len(header) else row for row in rows]
+            columns=list(zip(*rows))
+            dates=np.array(columns[date_position],dtype='datetime64[D]')
+            keep=np.ones(len(dates),dtype=bool)
+            if start_date is not None:
+                keep&=dates>=np.datetime64(start_date,'D')
+            if end_date is not None:
+                keep&=dates<=np.datetime64(end_date,'D')
+            date_chunks.append(dates[keep])
+            for label,i in data_positions:
+                data_chunks[label].append(to_float(columns[i])[keep])
+            for label,i in info_positions:
+                info_columns_dict[label].extend(np.array(columns[i],dtype=object)[keep].tolist())
+        dates=np.concatenate(date_chunks) if date_chunks else np.array([],dtype='datetime64[D]')
+        data_dict={label:np.concatenate(chunks) if chunks else np.array([]) for label,chunks in data_chunks.items()}
+        return sort_and_filter(dates,data_dict,info_columns_dict)
+    def write(self,dates_formatted,data_dict,info_columns_dict):
+        """
+        Store data in the layout read by load
+        """
+        with open(self.path,'w',newline='',encoding='utf-8') as f:
+            writer=csv.writer(f)
+            writer.writerow([date_column_label]+list(data_dict.keys())+list(info_columns_dict.keys()))
+            columns=[[date_str.replace(',','-') for date_str in dates_formatted]]
+            columns+=[['' if np.isnan(value) else repr(float(value)) for value in values] for values in data_dict.values()]
+            columns+=list(info_columns_dict.values())
+            writer.writerows(zip(*columns))
+
+class sqlite_source(data_source):
+    """
+    Table in an SQLite database with an index on the date column, date ranges are resolved by the database
+    """
+    def __init__(self,path,table='measurements'):
+        self.path=path
+        self.table=table
+        self.description=os.path.basename(path)
+    def load(self,start_date=None,end_date=None):
+        connection=sqlite3.connect(self.path)
+        try:
+            labels=[row[1] for row in connection.execute(f'PRAGMA table_info("{self.table}")')]
+            data_labels=[label for label in labels if label!=date_column_label and label not in info_labels]
+            selected_info_labels=[label for label in labels if label in info_labels]
+            query=f'SELECT {",".join(chr(34)+label+chr(34) for label in [date_column_label]+data_labels+selected_info_labels)} FROM "{self.table}"'
+            conditions=[]
+            parameters=[]
+            if start_date is not None:
+                conditions.append(f'"{date_column_label}">=?')
+                parameters.append(str(np.datetime64(start_date,'D')))
+            if end_date is not None:
+                conditions.append(f'"{date_column_label}"<=?')
+                parameters.append(str(np.datetime64(end_date,'D')))
+            if conditions:
+                query+=' WHERE '+' AND '.join(conditions)
+            query+=f' ORDER BY "{date_column_label}"'
+            rows=connection.execute(query,parameters).fetchall()
+        finally:
+            connection.close()
+        columns=list(zip(*rows)) if rows else [[] for _ in range(1+len(data_labels)+len(selected_info_labels))]
+        dates=np.array(columns[0],dtype='datetime64[D]')
+        data_dict={label:np.array(columns[1+i],dtype=float) for i,label in enumerate(data_labels)}
+        info_columns_dict={label:['' if info is None else info for info in columns[1+len(data_labels)+i]] for i,label in enumerate(selected_info_labels)}
+        return format_dates(dates),data_dict,info_columns_dict
+    def write(self,dates_formatted,data_dict,info_columns_dict):
+        """
+        Store data in a new table in the layout read by load, the date column is indexed
+        """
+        labels=[date_column_label]+list(data_dict.keys())+list(info_columns_dict.keys())
+        types=['TEXT']+['REAL']*len(data_dict)+['TEXT']*len(info_columns_dict)
+        connection=sqlite3.connect(self.path)
+        try:
+            connection.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+            connection.execute(f'CREATE TABLE "{self.table}" ({",".join(chr(34)+label+chr(34)+" "+column_type for label,column_type in zip(labels,types))})')
+            columns=[[date_str.replace(',','-') for date_str in dates_formatted]]
+            columns+=[[None if np.isnan(value) else float(value) for value in values] for values in data_dict.values()]
+            columns+=list(info_columns_dict.values())
+            connection.executemany(f'INSERT INTO "{self.table}" VALUES ({",".join("?"*len(labels))})',zip(*columns))
+            connection.execute(f'CREATE INDEX "{self.table}_date" ON "{self.table}" ("{date_column_label}")')
+            connection.commit()
+        finally:
+            connection.close()
+
+class parquet_source(data_source):
+    """
+    Parquet file read with pyarrow (optional dependency), only the requested columns are read and row groups
+    outside the date range are skipped
+    """
+    def __init__(self,path,columns=None):
+        """
+        Inputs:
+        path: path to the .parquet-file
+        columns: data/info column labels to read, None to read all columns
+        """
+        self.path=path
+        self.columns=columns
+        self.description=os.path.basename(path)
+    def load(self,start_date=None,end_date=None):
+        import pyarrow.parquet as pq
+        filters=[]
+        if start_date is not None:
+            filters.append((date_column_label,'>=',np.datetime64(start_date,'D').astype(object)))
+        if end_date is not None:
+            filters.append((date_column_label,'<=',np.datetime64(end_date,'D').astype(object)))
+        columns=None if self.columns is None else [date_column_label]+[label for label in self.columns if label!=date_column_label]
+        table=pq.read_table(self.path,columns=columns,filters=filters or None)
+        dates=table.column(date_column_label).to_numpy().astype('datetime64[D]')
+        data_dict={}
+        info_columns_dict={}
+        for label in table.column_names:
+            if label in info_labels:
+                info_columns_dict[label]=['' if info is None else info for info in table.column(label).to_pylist()]
+            elif label!=date_column_label:
+                data_dict[label]=table.column(label).to_numpy(zero_copy_only=False).astype(float)
+        return sort_and_filter(dates,data_dict,info_columns_dict)
+    def write(self,dates_formatted,data_dict,info_columns_dict):
+        """
+        Store data in the layout read by load
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        dates=np.array([date_str.replace(',','-') for date_str in dates_formatted],dtype='datetime64[D]')
+        columns={date_column_label:pa.array(dates)}
+        columns.update({label:pa.array(np.asarray(values,dtype=float),from_pandas=True) for label,values in data_dict.items()})
+        columns.update({label:pa.array(values,type=pa.string()) for label,values in info_columns_dict.items()})
+        pq.write_table(pa.table(columns),self.path)
+
+def get_data_source(name,path=None,offline=False,rows=1844,seed=None):
+    """
+    Create a data source from command-line arguments
+
+    Inputs:
+    name: 'sheets', 'mock', 'csv', 'sqlite' or 'parquet'
+    path: file to read for the csv, sqlite and parquet sources
+    offline: for the sheets source, only load the cached data
+    rows, seed: number of rows and random seed of the mock source
+
+    Output: data_source
+    """
+    match name:
+        case 'sheets':
+            return sheets_source(offline=offline)
+        case 'mock':
+            return mock_source(rows,seed,max_entries_per_day=max(1,-(-2*rows//36500)))
+    if path is None:
+        raise ValueError(f"A path is required for the {name} source")
+    match name:
+        case 'csv':
+            return csv_source(path)
+        case 'sqlite':
+            return sqlite_source(path)
+        case 'parquet':
+            return parquet_source(path)
+    raise ValueError(f"Unknown data source: {name}")
+
+def add_source_arguments(parser):
+    """
+    Add the command-line arguments selecting the data source to an argparse.ArgumentParser, see source_from_arguments
+    """
+    parser.add_argument('--source',choices=['sheets','mock','csv','sqlite','parquet'],default='sheets',help='where to load the data from')
+    parser.add_argument('--path',help='file to load for the csv, sqlite and parquet sources')
+    parser.add_argument('--start',help='first date to load (YYYY-MM-DD)')
+    parser.add_argument('--end',help='last date to load (YYYY-MM-DD)')
+    parser.add_argument('--offline',action='store_true',help='only show cached data, Google Sheets is not contacted')
+    parser.add_argument('--rows',type=int,default=1844,help='number of rows of the mock source')
+    parser.add_argument('--seed',type=int,help='random seed of the mock source')
+
+def source_from_arguments(parser,args):
+    """
+    Output: data_source selected by the arguments added with add_source_arguments, invalid combinations exit through parser.error
+    """
+    try:
+        return get_data_source(args.source,args.path,args.offline,args.rows,args.seed)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,207 @@
+"""
+Headless batch export of History and Comparison plots to image files, e.g. for nightly reports:
+
+python export.py --metrics "Weight [kg]" "Waist [cm]" --ranges : 2024: --comparisons "Days|A/B" --format png svg
+
+The data is loaded once and the plots are rendered offscreen in parallel by a pool of worker processes.
+"""
+import os
+os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
+import re
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from data_sources import add_source_arguments, source_from_arguments
+from backend import dataset
+
+#state of a worker process, set up once by init_worker and reused for all its jobs
+worker_state={}
+
+def init_worker(data,size):
+    """
+    Create the (offscreen) QApplication and the plot widgets of a worker process
+
+    Inputs:
+    data: backend.dataset shared by all jobs
+    size: (width, height) of the plot widgets in pixels
+    """
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtGui import QFont
+    import main
+    from backend import moving_average_cache
+    worker_state['app']=QApplication.instance() or QApplication([])
+    worker_state['app'].setFont(QFont('Times New Roman'))
+    worker_state['data']=data
+    worker_state['moving_average_dict']=moving_average_cache(data)
+    worker_state['size']=size
+    worker_state['main']=main
+
+def get_plotter(kind):
+    """
+    Output: the worker's chronological_plotter ('history') or data_analysis_plotter ('comparison'), created on first use
+    """
+    if kind not in worker_state:
+        main=worker_state['main']
+        plotter_class=main.chronological_plotter if kind=='history' else main.data_analysis_plotter
+        plotter=plotter_class(worker_state['data'],worker_state['moving_average_dict'])
+        plotter.resize(*worker_state['size'])
+        plotter.show()
+        worker_state[kind]=plotter
+    return worker_state[kind]
+
+def render_job(job):
+    """
+    Render one plot to image files
+
+    Inputs:
+    job: dictionary with
+         kind: 'history' or 'comparison'
+         metric (history): data label/ID to show
+         x, y (comparison): data labels/IDs, 'Days' or formulas
+         data_set (comparison): 'data' or 'moving_average'
+         window: moving average window
+         start, end: date strings limiting the shown range
+         paths: list of output files, the format follows from the extension (.png or .svg)
+
+    Output: list of the written files
+    """
+    data=worker_state['data']
+    start=job['start'] or data.date_str(0)
+    end=job['end'] or data.date_str(-1)
+    plotter=get_plotter(job['kind'])
+    if job['kind']=='history':
+        plotter.update_moving_average(job['window'])
+        plotter.left_y_data_picker.setCurrentText(job['metric'])
+        plotter.update_start(start)
+        plotter.update_end(end)
+    else:
+        worker_state['moving_average_dict'].set_window(job['window'])
+        (plotter.moving_average_indicator if job['data_set']=='moving_average' else plotter.data_indicator).click()
+        plotter.set_start_index(start)
+        plotter.set_end_index(end)
+        plotter.set_axis_data('x',job['x'])
+        plotter.set_axis_data('y',job['y'])
+        #a plot of other data than requested would be saved under the requested name
+        if (plotter.scatter_dict['x_label'],plotter.scatter_dict['y_label'])!=(job['x'],job['y']):
+            raise RuntimeError(f"Comparison shows {plotter.scatter_dict['y_label']} vs {plotter.scatter_dict['x_label']} instead of {job['y']} vs {job['x']}")
+    #the changes are applied with one deferred redraw, applied here before the ranges are read
+    plotter.redraw_scheduler.flush()
+    if job['kind']=='comparison':
+        plotter.figure.plotItem.vb.autoRange()
+    worker_state['app'].processEvents()
+    for path in job['paths']:
+        if path.endswith('.svg'):
+            save_svg(plotter.figure,path)
+        else:
+            plotter.figure.grab().save(path)
+    return job['paths']
+
+def save_svg(widget,path):
+    """
+    Render a widget into an SVG file (the pyqtgraph SVG exporter fails with recent Qt versions)
+    """
+    from PyQt6.QtSvg import QSvgGenerator
+    from PyQt6.QtGui import QPainter
+    generator=QSvgGenerator()
+    generator.setFileName(path)
+    generator.setSize(widget.size())
+    generator.setViewBox(widget.rect())
+    #in export mode pyqtgraph items draw vector shapes, e.g. scatter symbols instead of cached pixmaps
+    items=[item for item in widget.scene().items() if hasattr(item,'setExportMode')]
+    for item in items:
+        item.setExportMode(True,{'antialias':True})
+    painter=QPainter(generator)
+    widget.render(painter)
+    painter.end()
+    for item in items:
+        item.setExportMode(False)
+
+def file_name(text):
+    """
+    Output: text reduced to characters that are safe in file names
+    """
+    return re.sub(r'[^A-Za-z0-9]+','_',text).strip('_') or 'all'
+
+def build_jobs(data,metrics,ranges,comparisons,windows,data_set,formats,output_dir):
+    """
+    Inputs:
+    data: backend.dataset
+    metrics: data labels/IDs to export History plots of
+    ranges: list of (start, end) date strings, None for the first/last date
+    comparisons: list of (x, y) tuples of data labels/IDs, 'Days' or formulas to export Comparison plots of
+    windows: moving average windows
+    data_set: 'data' or 'moving_average', the data shown in Comparison plots
+    formats: file extensions, 'png' and/or 'svg'
+    output_dir: directory for the files
+
+    Output: list of jobs for render_job
+    """
+    jobs=[]
+    for start,end in ranges:
+        range_name=f"{file_name(start or '')}-{file_name(end or '')}"
+        for window in windows:
+            for metric in metrics:
+                if metric not in data.data_dict:
+                    raise ValueError(f"Unknown metric: {metric}")
+                name=f"history_{file_name(metric)}_avg{window}_{range_name}"
+                jobs.append({'kind':'history','metric':metric,'window':window,'start':start,'end':end,
+                             'paths':[os.path.join(output_dir,f"{name}.{extension}") for extension in formats]})
+            for x,y in comparisons:
+                name=f"comparison_{file_name(y)}_vs_{file_name(x)}_{data_set}{window if data_set=='moving_average' else ''}_{range_name}"
+                jobs.append({'kind':'comparison','x':x,'y':y,'data_set':data_set,'window':window,'start':start,'end':end,
+                             'paths':[os.path.join(output_dir,f"{name}.{extension}") for extension in formats]})
+    return jobs
+
+def export(data,jobs,workers=None,size=(1200,700)):
+    """
+    Render jobs (see build_jobs) on a pool of worker processes, each worker receives data once
+
+    Output: list of the written files
+    """
+    for job in jobs:
+        for path in job['paths']:
+            os.makedirs(os.path.dirname(path) or '.',exist_ok=True)
+    workers=max(1,min(workers or os.cpu_count() or 1,len(jobs)))
+    #workers are spawned rather than forked, Qt does not support forking
+    with ProcessPoolExecutor(workers,mp_context=multiprocessing.get_context('spawn'),initializer=init_worker,initargs=(data,size)) as executor:
+        return [path for paths in executor.map(render_job,jobs) for path in paths]
+
+def parse_range(text):
+    """
+    Output: (start, end) from a string of the form START:END, either may be empty for the first/last date
+    """
+    start,_,end=text.partition(':')
+    return start.strip() or None,end.strip() or None
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Export History and Comparison plots to image files without opening a window')
+    add_source_arguments(parser)
+    parser.add_argument('--output',default='export',help='directory for the image files')
+    parser.add_argument('--metrics',nargs='*',help='data columns to export History plots of, all if omitted')
+    parser.add_argument('--ranges',nargs='+',default=[':'],help='date ranges START:END (Year,Month,Day, either may be empty)')
+    parser.add_argument('--comparisons',nargs='*',default=[],help='Comparison plots X|Y, each a data column, Days or formula')
+    parser.add_argument('--comparison-data',choices=['data','moving_average'],default='moving_average',help='data shown in Comparison plots')
+    parser.add_argument('--windows',nargs='+',type=int,default=[7],help='moving average windows')
+    parser.add_argument('--format',nargs='+',choices=['png','svg'],default=['png'],help='image formats')
+    parser.add_argument('--size',default='1200x700',help='plot size in pixels, WIDTHxHEIGHT')
+    parser.add_argument('--workers',type=int,help='number of worker processes, the CPU count if omitted')
+    args=parser.parse_args()
+    loaded=source_from_arguments(parser,args).load(args.start,args.end)
+    if loaded is None or len(loaded[0])==0:
+        parser.exit(1,'No data to export\n')
+    data=dataset.from_columns(*loaded)
+    comparisons=[]
+    for comparison in args.comparisons:
+        x,separator,y=comparison.partition('|')
+        if not separator:
+            parser.error(f"Comparison not of the form X|Y: {comparison}")
+        comparisons.append((x.strip(),y.strip()))
+    try:
+        jobs=build_jobs(data,data.labels if args.metrics is None else args.metrics,[parse_range(text) for text in args.ranges],
+                        comparisons,args.windows,args.comparison_data,args.format,args.output)
+        size=tuple(int(value) for value in args.size.lower().split('x'))
+    except ValueError as e:
+        parser.error(str(e))
+    for path in export(data,jobs,args.workers,size):
+        print(path)
@@ -1,5 +1,12 @@
+import time
+import numpy as np
+from collections import deque
 from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLayout, QLabel
-from pyqtgraph import PlotWidget
+from PyQt6.QtCore import Qt, QRectF, QObject, QTimer
+from PyQt6.QtGui import QPainter, QColor
+from pyqtgraph import PlotWidget, GraphicsObject, mkPen, arrayToQPath
+
+import profiling
 def stack_in_layout(QItems_list,layout_type='v'):
     """
     Stack QWidgets and/or QLayouts into a QHBoxLayout or QVBoxLayout, the stacking follows the order of QItems_list
@@ -28,8 +35,68 @@ def stack_in_layout(QItems_list,layout_type='v'):
                 layout.addWidget(QItem[0],stretch=QItem[1])
     return layout
 
+class timed_plot_widget(PlotWidget):
+    """
+    PlotWidget timing its redraws, the durations are logged as stage 'redraw' (see profiling) and, with overlay,
+    drawn together with the frame rate of the last second in the top right corner
+    """
+    def __init__(self,overlay=False):
+        super().__init__()
+        self.overlay=overlay
+        self.paint_end_times=deque(maxlen=1000)
+    def paintEvent(self,event):
+        start_time=time.perf_counter()
+        super().paintEvent(event)
+        end_time=time.perf_counter()
+        profiling.record('redraw',end_time-start_time)
+        if self.overlay:
+            self.paint_end_times.append(end_time)
+            while end_time-self.paint_end_times[0]>1.0:
+                self.paint_end_times.popleft()
+            #drawn onto the finished frame, a label widget on top would trigger another redraw whenever its text changes
+            painter=QPainter(self.viewport())
+            painter.setPen(QColor(80,80,80))
+            painter.drawText(self.viewport().rect().adjusted(0,4,-6,0),Qt.AlignmentFlag.AlignRight|Qt.AlignmentFlag.AlignTop,
+                             f"Redraw {(end_time-start_time)*1000:.1f} ms, {len(self.paint_end_times)} fps")
+            painter.end()
+
+class redraw_scheduler(QObject):
+    """
+    Coalesces the redraw requests of a widget: request marks the widget dirty and redraw is called once on the next
+    event loop tick, however many requests were made before. Hidden widgets (e.g. background tabs) stay dirty, the
+    widget calls flush from its showEvent to redraw before it is first painted.
+    """
+    def __init__(self,widget,redraw):
+        """
+        Inputs:
+        widget: QWidget to redraw
+        redraw: function applying all pending changes
+        """
+        super().__init__(widget)
+        self.widget=widget
+        self.redraw=redraw
+        self.dirty=False
+        self.timer=QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.flush)
+    def request(self):
+        self.dirty=True
+        if self.widget.isVisible() and not self.timer.isActive():
+            self.timer.start()
+    def flush(self):
+        """
+        Redraw now if a redraw is pending and the widget is visible
+        """
+        if self.dirty and self.widget.isVisible():
+            self.dirty=False
+            self.redraw()
+
 def get_prepared_plot_widget(palette=None):
-    figure=PlotWidget()
+    if profiling.log_path or profiling.show_overlay:
+        figure=timed_plot_widget(profiling.show_overlay)
+    else:
+        figure=PlotWidget()
     figure.getAxis('left').setTextPen('k')
     figure.getAxis('bottom').setTextPen('k')
     figure.getAxis('left').setPen('k')
@@ -48,4 +115,48 @@ def get_prepared_plot_widget(palette=None):
 def QLabel_applied_stylesheet(text,stylesheet={}):
     temp=QLabel(text)
     temp.setStyleSheet(stylesheet)
-    return temp
\ No newline at end of file
+    return temp
+
+class colour_graded_curve(GraphicsObject):
+    """
+    Plot item drawing a line whose colour changes along the data, the line is split into consecutive
+    segments that are each drawn as one path with its own pen
+    """
+    def __init__(self,width=3):
+        super().__init__()
+        self.width=width
+        self.segments=[]
+        self.bounds=QRectF()
+        self.x_range=(None,None)
+        self.y_range=(None,None)
+    def setData(self,x,y,colors):
+        """
+        Inputs:
+        x,y: numpy arrays with the data, non-finite values break the line
+        colors: colours (anything accepted by mkPen) of the segments, the data is split into len(colors) segments of about equal length
+        """
+        self.prepareGeometryChange()
+        N=len(x)
+        self.segments=[]
+        if N>1 and len(colors)>0:
+            boundaries=np.linspace(0,N-1,len(colors)+1).astype(int)
+            for color,i_start,i_stop in zip(colors,boundaries[:-1],boundaries[1:]):
+                if i_stop>i_start:
+                    self.segments.append((mkPen(color=color,width=self.width),arrayToQPath(x[i_start:i_stop+1],y[i_start:i_stop+1],connect='finite')))
+        finite=np.isfinite(x)&np.isfinite(y)
+        if finite.any():
+            self.x_range=(float(np.min(x[finite])),float(np.max(x[finite])))
+            self.y_range=(float(np.min(y[finite])),float(np.max(y[finite])))
+            self.bounds=QRectF(self.x_range[0],self.y_range[0],self.x_range[1]-self.x_range[0],self.y_range[1]-self.y_range[0])
+        else:
+            self.x_range=self.y_range=(None,None)
+            self.bounds=QRectF()
+        self.update()
+    def dataBounds(self,ax,frac=1.0,orthoRange=None):
+        return self.x_range if ax==0 else self.y_range
+    def boundingRect(self):
+        return self.bounds
+    def paint(self,p,*args):
+        for pen,path in self.segments:
+            p.setPen(pen)
+            p.drawPath(path)
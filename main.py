@@ -5,26 +5,40 @@
 #display formula instructions when hovering over some icon that appears when clicking formula
 #fix bug that selects text in a different widget when choosing formula
 
+import time
+startup_time=time.perf_counter()
+import os
+import argparse
+import warnings
 import numpy as np
+from collections import OrderedDict
 from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QGridLayout, QLineEdit, QLabel, QComboBox, QTabWidget, QRadioButton, QPushButton
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QFont, QPalette, QIcon
-from pyqtgraph import mkPen, mkColor, InfiniteLine, SignalProxy, ScatterPlotItem, ViewBox, PlotCurveItem, ScatterPlotItem, ColorMap
+from pyqtgraph import mkPen, mkBrush, mkColor, InfiniteLine, SignalProxy, ScatterPlotItem, ViewBox, PlotCurveItem, ScatterPlotItem, ColorMap
 
-from frontend_utils import stack_in_layout, get_prepared_plot_widget, QLabel_applied_stylesheet
-from backend import get_data, get_mock_data, moving_average, recursive_parse
+from data_sources import add_source_arguments, source_from_arguments
+from frontend_utils import stack_in_layout, get_prepared_plot_widget, QLabel_applied_stylesheet, colour_graded_curve, redraw_scheduler
+import profiling
+from backend import dataset, calendar_aggregate, moving_average_cache, compile_formula, evaluate_formula, decimation_pyramid, range_statistics, moving_average_changed_from, point_index
+import_duration=time.perf_counter()-startup_time
 
 class chronological_plotter(QWidget):
     """
     GUI-object for displaying data as a time series (days on the bottom x-axis and year-ticks on the top x-axis)
     """
-    def __init__(self,dates_formatted,data_dict,moving_average_dict,info_columns_dict,styles={"font-family":"Times New Roman"}):
+    def __init__(self,data,moving_average_dict,styles={"font-family":"Times New Roman"},aggregate=None):
+        """
+        Inputs:
+        data: backend.dataset to show, for an aggregated view aggregate.data
+        moving_average_dict: backend.moving_average_cache of data
+        aggregate: backend.calendar_aggregate for an aggregated view, its statistics and info entries are shown on hover
+        """
         super().__init__()
-        self.dates_formatted=dates_formatted
-        self.days=np.linspace(0,len(self.dates_formatted)-1,len(self.dates_formatted))
-        self.data_dict=data_dict
+        self.data=data
         self.moving_average_dict=moving_average_dict
-        self.info_columns_dict=info_columns_dict
+        self.aggregate=aggregate
+        self.info_labels=aggregate.source.info_labels if aggregate else data.info_labels
 
         crosshair_color="#ff00ff"
         self.right_y_color="k"
@@ -40,8 +54,20 @@ class chronological_plotter(QWidget):
         self.figure.plotItem.getAxis('right').linkToView(self.right_y_axis_graph)
         self.right_y_axis_graph.setXLink(self.figure.plotItem)
         
-        self.xMax=len(self.dates_formatted)-1
+        self.xMax=self.data.days[-1]
         self.moving_avg_window=7
+        self.hover_labels=[]
+        for label in self.data.labels:
+            y_metric,y_unit=label.split(' [')
+            self.hover_labels.append((label,y_metric,y_unit.strip(']')))
+        self.hover_text_cache={}
+        self.crosshair_index=None
+        #decimation pyramids keyed by (kind, label, window), see get_visible_data
+        self.pyramids=OrderedDict()
+        self.pyramids_maxsize=16
+        self.moving_average_dict.set_window(self.moving_avg_window)
+        self.moving_average_changed=False
+        self.redraw_scheduler=redraw_scheduler(self,self.apply_changes)
         self.left_y_axis_graph.sigResized.connect(self.update_views)
 
         self.figure.setLabel('bottom','Days elapsed [#]',**self.styles)
@@ -53,7 +79,7 @@ class chronological_plotter(QWidget):
         
         self.left_y_data_picker=QComboBox()
         self.right_y_data_picker=QComboBox()
-        for label in self.data_dict.keys():
+        for label in self.data.labels:
             self.left_y_data_picker.addItem(label)
             self.right_y_data_picker.addItem(label)
         self.left_y_data_picker.addItem('')
@@ -67,13 +93,9 @@ class chronological_plotter(QWidget):
                                        QLabel('Right y-axis:'),self.right_y_data_picker,('stretch',1),
                                        QLabel('Show data as: '),dots_lines_layout,('stretch',1)],'h')
         picker_layout.setSpacing(2)
-        year_rows=[]
-        for i,dStr in enumerate(self.dates_formatted):
-            y,m,d=dStr.split(',')
-            if m+d=='0101':
-                year_rows.append((i,y))
-                self.left_y_axis_graph.addItem(InfiniteLine(pos=i,angle=90,pen=pen2))
-        self.figure.getAxis('top').setTicks([year_rows,[]])
+        self.year_line_pen=pen2
+        self.year_rows=[]
+        self.add_year_lines()
 
         left_layout=stack_in_layout([self.figure,picker_layout])
         mainGraphLayout=stack_in_layout([(left_layout,4),(self.infoLabel,1)],'h')
@@ -114,15 +136,65 @@ class chronological_plotter(QWidget):
                                                        'moving_average_plot':None,
                                                        'crosshair_data_point':self.dataPointCircle_right,
                                                        'crosshair_vertical_line':self.crosshair_v_right}}
+        self.left_y_axis_graph.sigResized.connect(self.redraw_scheduler.request)
+        self.left_y_axis_graph.sigXRangeChanged.connect(self.redraw_scheduler.request)
         self.lines_rb.click()
         self.left_y_data_picker.currentTextChanged.connect(self.change_y_data)
         self.right_y_data_picker.currentTextChanged.connect(self.change_y_data)
-        #the 1st added item is set to current, change to update moving averages and then change back
-        self.left_y_data_picker.setCurrentIndex(1)
-        self.left_y_data_picker.setCurrentIndex(0)
-        self.right_y_data_picker.setCurrentIndex(len(self.data_dict))
+        #the 1st added item is set to current, the data of both axes is set once when the widget is first shown
+        self.change_y_data(self.left_y_data_picker.currentText(),self.left_right_dict[self.left_y_data_picker])
+        self.right_y_data_picker.setCurrentIndex(len(self.data.labels))
         self.start_index=0
-        self.end_index=len(self.dates_formatted)
+        self.end_index=len(self.data)-1
+    def add_year_lines(self):
+        """
+        Add a vertical line and a top-axis tick for each year start not shown yet
+        """
+        year_rows=self.data.index.year_starts()
+        for day,_ in year_rows[len(self.year_rows):]:
+            self.left_y_axis_graph.addItem(InfiniteLine(pos=day,angle=90,pen=self.year_line_pen))
+        self.year_rows=year_rows
+        self.figure.getAxis('top').setTicks([year_rows,[]])
+    def extend(self,old_N):
+        """
+        Show rows appended to the data (of old_N rows before): the decimation pyramids are extended from the first
+        changed sample and the curves are set to the visible points, so the cost depends on the number of new rows.
+        A range ending at the last row is extended to the new last row.
+        """
+        changed_from=moving_average_changed_from(old_N,self.moving_avg_window)
+        for pyramid_key,pyramid in list(self.pyramids.items()):
+            kind,label,window=pyramid_key
+            if kind=='data':
+                pyramid.extend(self.data.days,self.data.data_dict[label],old_N)
+            elif window==self.moving_avg_window:
+                pyramid.extend(self.data.days,self.moving_average_dict[label],changed_from)
+            else:
+                #only the moving averages of the current window are kept up to date
+                del self.pyramids[pyramid_key]
+        self.hover_text_cache={index:text for index,text in self.hover_text_cache.items() if index<changed_from}
+        self.crosshair_index=None
+        self.xMax=self.data.days[-1]
+        self.add_year_lines()
+        if self.end_index==old_N-1:
+            self.end_index=len(self.data)-1
+            self.figure.setXRange(self.data.days[self.start_index],self.data.days[self.end_index],padding=0.002)
+        self.redraw_scheduler.request()
+    def apply_changes(self):
+        """
+        Apply the changes requested since the last redraw (see redraw_scheduler): set the data of the axes whose data
+        was picked, update the moving averages after a window change and show the points visible in the x-range
+        """
+        for y_dict in self.left_right_dict.values():
+            if 'pending_label' in y_dict:
+                self.set_y_data(y_dict.pop('pending_label'),y_dict)
+            elif self.moving_average_changed and y_dict['y_data_label']:
+                self.plot_moving_average(y_dict)
+        self.moving_average_changed=False
+        self.update_level_of_detail()
+    def showEvent(self,event):
+        super().showEvent(event)
+        #changes requested while the tab was hidden are applied before the first paint
+        self.redraw_scheduler.flush()
     def update_views(self):
         """
         Function for updating the scaling of the right y-axis, required for proper appearance
@@ -131,17 +203,59 @@ class chronological_plotter(QWidget):
         self.right_y_axis_graph.linkedViewChanged(self.left_y_axis_graph, self.right_y_axis_graph.XAxis)
     def update_moving_average(self,moving_average_window):
         self.moving_avg_window=moving_average_window
-        for key in self.moving_average_dict.keys():
-            self.moving_average_dict[key]=moving_average(self.data_dict[key],self.moving_avg_window)
-        for _,y_dict in self.left_right_dict.items():
+        self.moving_average_dict.set_window(self.moving_avg_window)
+        self.hover_text_cache={}
+        self.crosshair_index=None
+        self.moving_average_changed=True
+        self.redraw_scheduler.request()
+    def plot_moving_average(self,y_dict):
+        """
+        Show the moving average of the data on one y-axis, the plot item is updated in place when it already exists
+        """
+        x,y=self.get_visible_data('moving_average',y_dict['y_data_label'])
+        name=f"{self.moving_avg_window}-{self.aggregate.period if self.aggregate else 'day'} avg."
+        if y_dict['moving_average_plot'] is None:
+            y_dict['moving_average_plot']=self.plot_type(x,y,pen=mkPen(color=y_dict['moving_average_color'],width=2),brush=y_dict['moving_average_color'])
+            y_dict['viewbox'].addItem(y_dict['moving_average_plot'])
+            self.legend.addItem(y_dict['moving_average_plot'],name=name)
+        else:
+            y_dict['moving_average_plot'].setData(x=x,y=y)
+            self.legend.getLabel(y_dict['moving_average_plot']).setText(name)
+    def remove_plots(self,y_dict):
+        for plot_key in ['y_data_plot','moving_average_plot']:
+            if y_dict[plot_key]:
+                y_dict['viewbox'].removeItem(y_dict[plot_key])
+                self.legend.removeItem(y_dict[plot_key])
+                y_dict[plot_key]=None
+    def get_visible_data(self,kind,label):
+        """
+        Data for the current x-range, downsampled to about two points per pixel with a min/max decimation pyramid
+
+        Inputs:
+        kind: 'data' or 'moving_average'
+        label: data label/ID in data.data_dict
+
+        Outputs: x- and y-values to plot
+        """
+        pyramid_key=(kind,label,self.moving_average_dict.window if kind=='moving_average' else None)
+        if pyramid_key in self.pyramids:
+            self.pyramids.move_to_end(pyramid_key)
+        else:
+            values=self.data.data_dict[label] if kind=='data' else self.moving_average_dict[label]
+            self.pyramids[pyramid_key]=decimation_pyramid(self.data.days,values)
+            if len(self.pyramids)>self.pyramids_maxsize:
+                self.pyramids.popitem(last=False)
+        x_start,x_end=self.left_y_axis_graph.viewRange()[0]
+        return self.pyramids[pyramid_key].get_data(x_start,x_end,2*max(int(self.left_y_axis_graph.width()),1))
+    @profiling.timed('history_level_of_detail')
+    def update_level_of_detail(self):
+        for y_dict in self.left_right_dict.values():
             if y_dict['y_data_label']:
+                x,y=self.get_visible_data('data',y_dict['y_data_label'])
+                y_dict['y_data_plot'].setData(x=x,y=y)
                 if y_dict['moving_average_plot']:
-                    y_dict['viewbox'].removeItem(y_dict['moving_average_plot'])
-                    self.legend.removeItem(y_dict['moving_average_plot'])
-                moving_average_values=self.moving_average_dict[y_dict['y_data_label']]
-                y_dict['moving_average_plot']=self.plot_type(self.days,moving_average_values,pen=mkPen(color=y_dict['moving_average_color'],width=2),brush=y_dict['moving_average_color'])
-                y_dict['viewbox'].addItem(y_dict['moving_average_plot'])
-                self.legend.addItem(y_dict['moving_average_plot'],name=f"{self.moving_avg_window}-day avg.")
+                    x,y=self.get_visible_data('moving_average',y_dict['y_data_label'])
+                    y_dict['moving_average_plot'].setData(x=x,y=y)
     def update_crosshair(self, e):
         pos = e[0]
         if self.figure.sceneBoundingRect().contains(pos):
@@ -151,34 +265,54 @@ class chronological_plotter(QWidget):
                 x_position=0
             elif x_position>self.xMax:
                 x_position=self.xMax
+            x_index=self.data.index.nearest_index(x_position)
+            #the crosshair snaps to rows, so nothing changes until the cursor moves to another row
+            if x_index==self.crosshair_index:
+                return
+            self.crosshair_index=x_index
             for data_picker in [self.left_y_data_picker,self.right_y_data_picker]:
                 y_dict=self.left_right_dict[data_picker]
                 if y_dict['y_data_label']:
-                    y_dict['crosshair_vertical_line'].setPos(x_position)
-                    y_dict['crosshair_data_point'].clear()
-                    x_index=round(x_position)
-                    y_value=self.data_dict[y_dict['y_data_label']][x_index]
+                    y_dict['crosshair_vertical_line'].setPos(self.data.days[x_index])
+                    y_value=self.data.data_dict[y_dict['y_data_label']][x_index]
                     if not np.isnan(y_value):
-                        y_dict['crosshair_data_point'].addPoints([x_position], [y_value])
-            y_str=''
-            if 'x_index' in locals():
-                for label,y_data in self.data_dict.items():
-                    y_metric,y_unit=label.split(' [')
-                    y_metric_moving_avg=self.moving_average_dict[label][x_index]
-                    if not np.isnan(y_data[x_index]):
-                        y_str+=f"{y_metric}: {np.round(y_data[x_index],decimals=1)} (Avg. {np.round(y_metric_moving_avg,decimals=1)}) {y_unit.strip(']')}\n"
+                        y_dict['crosshair_data_point'].setData([self.data.days[x_index]], [y_value])
                     else:
-                        y_str+=f"{y_metric}:\n"
+                        y_dict['crosshair_data_point'].clear()
+            date_str,y_str,info_str=self.get_hover_text(x_index)
+            if not any(y_dict['y_data_label'] for y_dict in self.left_right_dict.values()):
+                y_str=''
+            self.infoLabel.setText(f"{date_str}\n{y_str}{info_str}")
+    def get_hover_text(self,index):
+        """
+        Info panel text for a row, built on first use and kept until the moving average window changes
+
+        Output: tuple of strings with the date, the data values and the info columns
+        """
+        if index not in self.hover_text_cache:
+            y_str=''
+            for i,(label,y_metric,y_unit) in enumerate(self.hover_labels):
+                y_value=self.data.data_dict[label][index]
+                if not np.isnan(y_value):
+                    y_str+=f"{y_metric}: {np.round(y_value,decimals=1)} (Avg. {np.round(self.moving_average_dict.value_at(label,index),decimals=1)}) {y_unit}\n"
+                    if self.aggregate:
+                        y_str+=(f"    Min. {np.round(self.aggregate.minimum[i,index],decimals=1)}, max. {np.round(self.aggregate.maximum[i,index],decimals=1)},"
+                                f" {self.aggregate.count[i,index]} entries\n")
+                else:
+                    y_str+=f"{y_metric}:\n"
             info_str=''
-            for label,info in self.info_columns_dict.items():
-                info_str+=f"\n{label}:\n{info[x_index]}\n"
-            self.infoLabel.setText(f"{self.dates_formatted[x_index]}\n{y_str}{info_str}")
+            for label in self.info_labels:
+                info=self.aggregate.info(label,index) if self.aggregate else self.data.info(label,index)
+                info_str+=f"\n{label}:\n{info}\n"
+            date_str=self.aggregate.label(index) if self.aggregate else self.data.date_str(index)
+            self.hover_text_cache[index]=(date_str,y_str,info_str)
+        return self.hover_text_cache[index]
     def update_start(self,startStr):
-        self.start_index=self.dates_formatted.index(startStr)
-        self.figure.setXRange(self.start_index,self.end_index,padding=0.002)
+        self.start_index=self.data.index.lookup(startStr,'start')
+        self.figure.setXRange(self.data.days[self.start_index],self.data.days[self.end_index],padding=0.002)
     def update_end(self,endStr):
-        self.end_index=self.dates_formatted.index(endStr)
-        self.figure.setXRange(self.start_index,self.end_index,padding=0.002)
+        self.end_index=self.data.index.lookup(endStr,'end')
+        self.figure.setXRange(self.data.days[self.start_index],self.data.days[self.end_index],padding=0.002)
     def change_plot_type(self):
         if self.sender()==self.dots_rb:
             self.plot_type=ScatterPlotItem
@@ -186,31 +320,39 @@ class chronological_plotter(QWidget):
             self.plot_type=PlotCurveItem
         for _,y_dict in self.left_right_dict.items():
             if y_dict['y_data_label']:
-                self.change_y_data(y_dict['y_data_label'],y_dict)
+                #the plot item type changes, so the items are rebuilt
+                self.remove_plots(y_dict)
+                self.change_y_data(y_dict.get('pending_label',y_dict['y_data_label']),y_dict)
     def change_y_data(self,text,y_dict=None):
+        """
+        Show other data on an axis, applied with the next redraw
+        """
         if not y_dict:
             y_dict=self.left_right_dict[self.sender()]
-        if y_dict['y_data_plot']:
-            y_dict['viewbox'].removeItem(y_dict['y_data_plot'])
-            self.legend.removeItem(y_dict['y_data_plot'])
+        y_dict['pending_label']=text
+        self.redraw_scheduler.request()
+    @profiling.timed('history_rebuild')
+    def set_y_data(self,text,y_dict):
+        self.crosshair_index=None
         if text!='':
             y_dict['crosshair_vertical_line'].show()
             y_dict['crosshair_data_point'].show()
             y_dict['y_data_label']=text
-            y_dict['y_data_plot']=self.plot_type(self.days,self.data_dict[y_dict['y_data_label']],pen=mkPen(color=y_dict['y_color']),brush=y_dict['y_color'])
-            self.legend.addItem(y_dict['y_data_plot'],name='Data')
-            y_dict['viewbox'].addItem(y_dict['y_data_plot'])
-            self.update_moving_average(self.moving_avg_window)
+            x,y=self.get_visible_data('data',y_dict['y_data_label'])
+            if y_dict['y_data_plot'] is None:
+                y_dict['y_data_plot']=self.plot_type(x,y,pen=mkPen(color=y_dict['y_color']),brush=y_dict['y_color'])
+                self.legend.addItem(y_dict['y_data_plot'],name='Data')
+                y_dict['viewbox'].addItem(y_dict['y_data_plot'])
+            else:
+                y_dict['y_data_plot'].setData(x=x,y=y)
+            self.plot_moving_average(y_dict)
             self.figure.getAxis(y_dict['axis']).setTicks(None)
             self.figure.getAxis(y_dict['axis']).setLabel(text,**self.styles)
-            y_dict['viewbox'].setYRange(np.nanmin(self.data_dict[y_dict['y_data_label']])*.95,np.nanmax(self.data_dict[y_dict['y_data_label']])*1.05)
+            y_values=self.data.data_dict[y_dict['y_data_label']]
+            y_dict['viewbox'].setYRange(np.nanmin(y_values)*.95,np.nanmax(y_values)*1.05)
         else:
-            if y_dict['moving_average_plot']:
-                y_dict['viewbox'].removeItem(y_dict['moving_average_plot'])
-                self.legend.removeItem(y_dict['moving_average_plot'])
+            self.remove_plots(y_dict)
             y_dict['y_data_label']=None
-            y_dict['y_data_plot']=None
-            y_dict['moving_average_plot']=None
             y_dict['crosshair_vertical_line'].hide()
             y_dict['crosshair_data_point'].hide()
             self.figure.getAxis(y_dict['axis']).setLabel('',**self.styles)
@@ -220,17 +362,25 @@ class data_analysis_plotter(QWidget):
     """
     GUI-object for displaying a scatter plot with user-defined data on the x- and y-axes
     """
-    def __init__(self,dates_formatted,data_dict,moving_average_dict,styles={"font-family":"Times New Roman"}):
+    #message about an entered formula that was rejected, empty when a formula is accepted
+    formula_checked=pyqtSignal(str)
+    def __init__(self,data,moving_average_dict,styles={"font-family":"Times New Roman"},aggregate=None):
+        """
+        Inputs:
+        data: backend.dataset to show, for an aggregated view aggregate.data
+        moving_average_dict: backend.moving_average_cache of data
+        aggregate: backend.calendar_aggregate for an aggregated view, its info entries are shown on hover
+        """
         super().__init__()
-        self.dates_formatted=dates_formatted
-        self.data_dict=data_dict
+        self.data=data
         self.moving_average_dict=moving_average_dict
+        self.aggregate=aggregate
+        self.info_labels=aggregate.source.info_labels if aggregate else data.info_labels
 
         self.figure=get_prepared_plot_widget(self.palette().color(QPalette.ColorRole.Window))
         self.styles=styles
-        self.days=np.linspace(1,len(self.dates_formatted),len(self.dates_formatted))
-        self.scatter_dict={'x_label':None,'x_data':None,'y_label':None,'y_data':None,
-                           'data_plot_dict':None,'start_index':0,'end_index':len(self.dates_formatted)}
+        self.scatter_dict={'x_label':None,'x_data':None,'y_label':None,'y_data':None,'plot_type':None,
+                           'data_plot_dict':None,'start_index':0,'end_index':len(self.data)-1}
         self.x_formula_str='Formula'
         self.y_formula_str='Formula'
         # Define a continuous gradient
@@ -239,12 +389,38 @@ class data_analysis_plotter(QWidget):
         color=[( 0, 0, 255, 100),        # RGBA at pos 0
             (255, 0, 0, 255)]        # at pos 1
             )
+        self.color_cache={}
+        self.redraw_scheduler=redraw_scheduler(self,self.plot_data)
+        #the plot items are kept and updated with setData, the one not matching the plot type is hidden
+        self.scatter_plot=ScatterPlotItem(pen=None,size=10)
+        self.line_plot=colour_graded_curve(width=3)
+        self.figure.plotItem.vb.addItem(self.scatter_plot)
+        self.figure.plotItem.vb.addItem(self.line_plot)
+        self.fit_line=PlotCurveItem(pen=mkPen('k',width=2,style=Qt.PenStyle.DashLine))
+        self.figure.plotItem.vb.addItem(self.fit_line)
+        #the point nearest to the cursor (or the clicked point, until the next click) is marked and described
+        self.picked_point=ScatterPlotItem(size=14,pen=mkPen('#ff00ff',width=2),brush=None)
+        self.picked_point.setZValue(1000)
+        self.figure.plotItem.vb.addItem(self.picked_point,ignoreBounds=True)
+        self.pick_distance=20
+        self.pinned_row=None
+        #built from the plotted points on the first hover, rebuilt when the data, formula or range changes
+        self.point_index=None
+        self.point_index_key=None
+        self.hover_label=QLabel()
+        self.hover_label.setWordWrap(True)
+        self.hover_label.setAlignment(Qt.AlignmentFlag.AlignTop)
+        #keys=ids of the full-length source arrays, values=(source arrays, range_statistics)
+        self.statistics_cache=OrderedDict()
+        self.statistics_label=QLabel()
+        self.statistics_label.setTextFormat(Qt.TextFormat.RichText)
+        self.statistics_label.setAlignment(Qt.AlignmentFlag.AlignTop)
 
         self.y_data_picker=QComboBox()
         self.x_data_picker=QComboBox()
         self.data_formula_map_dict={}
         formula_info_str=''
-        for i,label in enumerate(list(self.data_dict.keys())+['Days',self.x_formula_str]):
+        for i,label in enumerate(self.data.labels+['Days',self.x_formula_str]):
             if label!=self.x_formula_str:
                 self.data_formula_map_dict[chr(65+i)]=label
                 formula_info_str+=f"{chr(65+i)}: {label}\n"
@@ -253,6 +429,7 @@ class data_analysis_plotter(QWidget):
         self.x_data_picker.setCurrentIndex(1)
         self.y_data_picker.setCurrentIndex(1)
         formula_info_str=formula_info_str[:-1]
+        self.statistics_label.setToolTip(formula_info_str)
         self.x_formula=QLineEdit()
         self.x_picker_show=QPushButton('List')
         self.x_picker_show.hide()
@@ -280,8 +457,10 @@ class data_analysis_plotter(QWidget):
         dots_lines_widget=QWidget()
         dots_lines_widget.setLayout(dots_lines_layout)
         bottom_layout=stack_in_layout([data_ma_widget,dots_lines_widget,stack_in_layout([('stretch',3),picker_layout,('stretch',1)])],'h')
-        layout=stack_in_layout([self.figure,bottom_layout])
+        layout=stack_in_layout([stack_in_layout([(self.figure,1),stack_in_layout([self.statistics_label,(self.hover_label,1)])],'h'),bottom_layout])
         self.setLayout(layout)
+        self.proxy=SignalProxy(self.figure.scene().sigMouseMoved,rateLimit=60,slot=self.update_hover)
+        self.figure.scene().sigMouseClicked.connect(self.pick)
 
         self.moving_average_indicator.clicked.connect(self.change_data_plot_dict)
         self.data_indicator.clicked.connect(self.change_data_plot_dict)
@@ -295,6 +474,17 @@ class data_analysis_plotter(QWidget):
         self.y_picker_show.pressed.connect(self.show_picker)
         self.x_picker_show.pressed.connect(self.show_picker)
         self.dots_rb.click()
+    def extend(self,old_N):
+        """
+        Show rows appended to the data (of old_N rows before), a range ending at the last row is extended to the new
+        last row. The plot is only redrawn if the shown range contains new or changed (moving average) values, the
+        colour grading spans the range, so it is redrawn as a whole.
+        """
+        self.statistics_cache.clear()
+        if self.scatter_dict['end_index']==old_N-1:
+            self.scatter_dict['end_index']=len(self.data)-1
+        if self.scatter_dict['end_index']>=moving_average_changed_from(old_N,self.moving_average_dict.window):
+            self.redraw_scheduler.request()
     def show_picker(self):
         if self.sender()==self.y_picker_show:
             self.y_data_picker.show()
@@ -304,21 +494,49 @@ class data_analysis_plotter(QWidget):
             self.x_picker_show.hide()
     def enter_formula(self):
         formula=self.sender().text()
+        #a rejected formula keeps the previous one shown
+        try:
+            program=compile_formula(formula)
+        except ValueError as e:
+            self.formula_checked.emit(str(e))
+            return
+        unknown_symbols=[value for kind,value in program if kind=='symbol' and value not in self.data_formula_map_dict]
+        if unknown_symbols:
+            self.formula_checked.emit(f"Unknown symbol {unknown_symbols[0]} in formula: {formula}")
+            return
+        self.formula_checked.emit('')
         if self.sender()==self.y_formula:
             self.y_formula_str=formula
             picker=self.y_data_picker
         else:
             self.x_formula_str=formula
             picker=self.x_data_picker
-        picker.setItemText(self.y_data_picker.count()-1,formula)
-        picker.activated.emit(self.y_data_picker.count()-1)
-        self.plot_data()
+        picker.setItemText(picker.count()-1,formula)
+        picker.setCurrentIndex(picker.count()-1)
+        picker.activated.emit(picker.count()-1)
+        self.redraw_scheduler.request()
+    def set_axis_data(self,axis,text):
+        """
+        Show a data label, 'Days' or a formula on an axis, as if it was picked or entered in the GUI
+
+        Inputs:
+        axis: 'x' or 'y'
+        text: data label/ID, 'Days' or formula string
+        """
+        line_edit,picker=(self.x_formula,self.x_data_picker) if axis=='x' else (self.y_formula,self.y_data_picker)
+        index=picker.findText(text)
+        if 0<=index<picker.count()-1:
+            picker.setCurrentIndex(index)
+            picker.activated.emit(index)
+        else:
+            line_edit.setText(text)
+            line_edit.returnPressed.emit()
     def change_data_plot_dict(self):
         if self.sender()==self.moving_average_indicator:
             self.scatter_dict['data_plot_dict']=self.moving_average_dict
         else:
-            self.scatter_dict['data_plot_dict']=self.data_dict
-        self.plot_data()
+            self.scatter_dict['data_plot_dict']=self.data.data_dict
+        self.redraw_scheduler.request()
     def change_data(self):
         text=self.sender().currentText()
         if self.sender()==self.y_data_picker:
@@ -333,127 +551,474 @@ class data_analysis_plotter(QWidget):
                 self.x_data_picker.hide()
                 self.x_picker_show.show()
         else:
-            self.plot_data()
+            self.redraw_scheduler.request()
     def set_start_index(self,startStr):
-        self.scatter_dict['start_index']=self.dates_formatted.index(startStr)
-        self.plot_data()
+        self.scatter_dict['start_index']=self.data.index.lookup(startStr,'start')
+        self.redraw_scheduler.request()
     def set_end_index(self,endStr):
-        self.scatter_dict['end_index']=self.dates_formatted.index(endStr)
-        self.plot_data()
-    def get_data(self,xy_label):
+        self.scatter_dict['end_index']=self.data.index.lookup(endStr,'end')
+        self.redraw_scheduler.request()
+    def get_data(self,xy_label,full_range=False):
+        """
+        Output: data of the x- or y-axis over the selected range, or over all rows if full_range
+        """
+        start_index,end_index=(0,None) if full_range else (self.scatter_dict['start_index'],self.scatter_dict['end_index']+1)
         data_label=self.scatter_dict[xy_label]
-        evaluate_formula=False
+        is_formula=False
         match data_label:
             case self.x_formula_str:
-                evaluate_formula=True
+                is_formula=True
                 self.x_formula_str=data_label
             case self.y_formula_str:
-                evaluate_formula=True
+                is_formula=True
                 self.y_formula_str=data_label
             case 'Days':
-                full_data_set=self.days
+                full_data_set=self.data.day_numbers
             case _:
                 full_data_set=self.scatter_dict['data_plot_dict'][data_label]
-        if evaluate_formula:
-            full_data_set,_=recursive_parse(data_label,self.data_formula_map_dict,self.scatter_dict['data_plot_dict'],self.days)
-        return full_data_set[self.scatter_dict['start_index']:self.scatter_dict['end_index']+1]
+        if is_formula:
+            return evaluate_formula(data_label,self.data_formula_map_dict,self.scatter_dict['data_plot_dict'],self.data.day_numbers,
+                                    start_index,end_index)
+        return full_data_set[start_index:end_index]
     def change_plot_type(self):
         if self.sender()==self.dots_rb:
             self.scatter_dict['plot_type']='dots'
         else:
             self.scatter_dict['plot_type']='lines'
-        self.plot_data()
+        self.redraw_scheduler.request()
+    def showEvent(self,event):
+        super().showEvent(event)
+        #changes requested while the tab was hidden are applied before the first paint
+        self.redraw_scheduler.flush()
+    @profiling.timed('comparison_rebuild')
     def plot_data(self):
+        if self.scatter_dict['x_label'] is None or self.scatter_dict['y_label'] is None or self.scatter_dict['plot_type'] is None:
+            return
+        x_data=self.get_data('x_label')
+        y_data=self.get_data('y_label')
+        self.scatter_dict['x_data'],self.scatter_dict['y_data']=x_data,y_data
+        index_key=(self.scatter_dict['x_label'],self.scatter_dict['y_label'],self.scatter_dict['data_plot_dict'] is self.moving_average_dict,
+                   self.moving_average_dict.window,self.scatter_dict['start_index'],self.scatter_dict['end_index'],len(self.data))
+        if index_key!=self.point_index_key:
+            self.point_index_key=index_key
+            self.point_index=None
+            self.pinned_row=None
+            self.show_point(None)
+        if self.scatter_dict['plot_type']=='dots':
+            self.line_plot.hide()
+            self.scatter_plot.setData(x=x_data,y=y_data,brush=self.get_brushes(len(x_data)))
+            self.scatter_plot.show()
+        else:
+            self.scatter_plot.hide()
+            self.line_plot.setData(x_data,y_data,self.get_segment_colors(len(y_data)))
+            self.line_plot.show()
+        self.update_statistics(x_data)
+    def update_hover(self,e):
+        if self.pinned_row is None:
+            self.show_point(self.pick_at(e[0]))
+    def pick(self,event):
+        """
+        Pin the clicked point, a click away from the points releases it
+        """
+        if event.button()==Qt.MouseButton.LeftButton:
+            self.pinned_row=self.pick_at(event.scenePos())
+            self.show_point(self.pinned_row)
+    def pick_at(self,pos):
+        """
+        Output: row of the plotted point nearest to a scene position (within pick_distance pixels), None if there is none
+        """
+        view_box=self.figure.plotItem.vb
+        if self.scatter_dict['x_data'] is None or not view_box.sceneBoundingRect().contains(pos):
+            return None
+        if self.point_index is None:
+            self.point_index=point_index(self.scatter_dict['x_data'],self.scatter_dict['y_data'])
+        position=view_box.mapSceneToView(pos)
+        pixel_width,pixel_height=view_box.viewPixelSize()
+        nearest=self.point_index.nearest(position.x(),position.y(),1/pixel_width,1/pixel_height,self.pick_distance)
+        return None if nearest is None else self.scatter_dict['start_index']+nearest[0]
+    def show_point(self,row):
+        """
+        Mark a row's point and show its date, values and info columns, None to clear
+        """
+        if row is None:
+            self.picked_point.clear()
+            self.hover_label.setText('')
+            return
+        x_value=self.scatter_dict['x_data'][row-self.scatter_dict['start_index']]
+        y_value=self.scatter_dict['y_data'][row-self.scatter_dict['start_index']]
+        self.picked_point.setData([x_value],[y_value])
+        text=f"{self.aggregate.label(row) if self.aggregate else self.data.date_str(row)}\n"
+        text+=f"x: {self.scatter_dict['x_label']} = {x_value:.4g}\ny: {self.scatter_dict['y_label']} = {y_value:.4g}\n"
+        for label in self.info_labels:
+            info=self.aggregate.info(label,row) if self.aggregate else self.data.info(label,row)
+            text+=f"\n{label}:\n{info}\n"
+        self.hover_label.setText(text)
+    def get_statistics(self,arrays):
+        """
+        Output: range_statistics of the rows stacked from arrays, reused while the same arrays are shown
+        """
+        key=tuple(id(array) for array in arrays)
+        if key in self.statistics_cache:
+            self.statistics_cache.move_to_end(key)
+        else:
+            #the cache keeps the arrays alive so that their ids can not be reused while cached
+            self.statistics_cache[key]=(arrays,range_statistics(np.vstack(arrays)))
+            if len(self.statistics_cache)>8:
+                self.statistics_cache.popitem(last=False)
+        return self.statistics_cache[key][1]
+    @profiling.timed('comparison_statistics')
+    def update_statistics(self,x_data):
+        """
+        Show the least-squares fit of the plotted data, the rolling standard deviation of the y-data and the
+        correlation matrix of the raw data over the selected range
+        """
+        start_index,end_index=self.scatter_dict['start_index'],self.scatter_dict['end_index']+1
+        pair_statistics=self.get_statistics((self.get_data('x_label',True),self.get_data('y_label',True)))
+        fit=pair_statistics.linear_fit(start_index,end_index)
+        window=self.moving_average_dict.window
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore',RuntimeWarning)
+            rolling_std=np.sqrt(pair_statistics.rolling_variance(start_index,end_index,1,window))
+            x_min,x_max=(np.nanmin(x_data),np.nanmax(x_data)) if len(x_data) else (np.nan,np.nan)
+            mean_rolling_std=np.nanmean(rolling_std)
+        if np.isfinite(fit['slope']):
+            self.fit_line.setData([x_min,x_max],[fit['intercept']+fit['slope']*x_min,fit['intercept']+fit['slope']*x_max])
+            self.fit_line.show()
+        else:
+            self.fit_line.hide()
+        #computed on the raw data, so that changing the moving average window doesn't compute the averages of every metric
+        columns=[self.data.data_dict[label] for label in self.data.labels]+[self.data.day_numbers]
+        correlation=self.get_statistics(columns).correlation_matrix(start_index,end_index)
+        symbols=list(self.data_formula_map_dict.keys())
+        text=(f"y = {fit['slope']:.4g}·x + {fit['intercept']:.4g}<br>r = {fit['r']:.3f}, R² = {fit['r']**2:.3f}, n = {fit['count']}<br>"
+              f"Rolling std. of y ({window} rows): {mean_rolling_std:.3g} (mean), {rolling_std[-1] if len(rolling_std) else np.nan:.3g} (last)"
+              "<table cellspacing='4'><tr><td></td>"+''.join(f"<td align='right'>{symbol}</td>" for symbol in symbols)+'</tr>')
+        for symbol,row in zip(symbols,correlation):
+            text+=f"<tr><td>{symbol}</td>"+''.join(f"<td align='right'>{value:.2f}</td>" for value in row)+'</tr>'
+        self.statistics_label.setText(text+'</table>')
+    def get_brushes(self,N):
+        """
+        Colour-graded brushes for N dots, cached per length. The gradient is quantized to 256 shared brushes, the
+        scatter plot renders one symbol per distinct brush.
+        """
+        if ('dots',N) not in self.color_cache:
+            if 'brush_levels' not in self.color_cache:
+                self.color_cache['brush_levels']=np.array([mkBrush(color) for color in self.cmap.mapToQColor(np.linspace(0,1,256))],dtype=object)
+            self.color_cache[('dots',N)]=self.color_cache['brush_levels'][np.round(np.linspace(0,255,N)).astype(np.intp)]
+        return self.color_cache[('dots',N)]
+    def get_segment_colors(self,N):
+        """
+        Colours of the (at most 100) line segments for N data points, cached per length
+        """
+        if ('lines',N) not in self.color_cache:
+            self.color_cache[('lines',N)]=self.cmap.mapToQColor(np.linspace(0,1,max(min(N-1,100),1)))
+        return self.color_cache[('lines',N)]
+
+class data_loader(QThread):
+    """
+    Worker thread running data loading functions in order, each non-None result is converted to a dataset and
+    emitted through loaded if it differs from the previous one, e.g. cached data first and then freshly fetched data
+    """
+    progress=pyqtSignal(str)
+    loaded=pyqtSignal(object)
+    failed=pyqtSignal(str)
+    step_finished=pyqtSignal(str,float)
+    def __init__(self,load_steps):
+        """
+        Inputs:
+        load_steps: list of (progress message, function) tuples, the functions return
+                    (dates_formatted,data_dict,info_columns_dict) or None
+        """
+        super().__init__()
+        self.load_steps=load_steps
+    def run(self):
+        profiling.profile_thread()
+        previous=None
+        for message,load_function in self.load_steps:
+            self.progress.emit(message)
+            step_start_time=time.perf_counter()
+            try:
+                data=load_function()
+            except Exception as e:
+                self.failed.emit(f"Loading data failed: {type(e).__name__}: {e}")
+                return
+            step_duration=time.perf_counter()-step_start_time
+            self.step_finished.emit(message.rstrip('.'),step_duration)
+            profiling.record('load_step',step_duration,step=message.rstrip('.'))
+            if data is None:
+                continue
+            data=dataset.from_columns(*data)
+            if not data.equals(previous):
+                self.loaded.emit(data)
+                previous=data
+        self.progress.emit('')
+
+class data_poller(QThread):
+    """
+    Worker thread loading the rows added to a data source after the shown ones (see data_source.load_new), the
+    new rows are emitted through appended as a dataset
+    """
+    appended=pyqtSignal(object)
+    failed=pyqtSignal(str)
+    def __init__(self,source,end_date=None):
+        super().__init__()
+        self.source=source
+        self.end_date=end_date
+        self.last_date=None
+        self.last_date_rows=0
+    def poll(self,data):
+        """
+        Start loading the rows added after the last row of data, unless the previous poll is still running
+        """
+        if data is None or len(data)==0 or self.isRunning():
+            return
+        self.last_date=str(data.dates[-1])
+        self.last_date_rows=int(len(data)-np.searchsorted(data.dates,data.dates[-1]))
+        self.start()
+    def run(self):
         try:
-            if isinstance(self.plot,list):
-                for p in self.plot:
-                    self.figure.plotItem.vb.removeItem(p)
-            else:
-                self.figure.plotItem.vb.removeItem(self.plot)
-        except:
-            pass
-        if self.scatter_dict['x_label'] is not None and self.scatter_dict['y_label'] is not None:
-            x_data=self.get_data('x_label')
-            if self.scatter_dict['plot_type']=='dots':
-                self.colors = self.cmap.mapToQColor(np.linspace(0, 1, len(x_data)))
-                self.plot = ScatterPlotItem(x=x_data, y=self.get_data('y_label'), pen=None, brush=self.colors, size=10)
-                self.figure.plotItem.vb.addItem(self.plot)
-            else:
-                y_data=self.get_data('y_label')
-                N_y=len(y_data)
-                N=min([N_y,100])
-                step=N_y//N
-                colors=self.cmap.map(np.linspace(0.0, 1.0, len(y_data)))[::step]
-                colors=np.vstack((colors,colors[-1]))
-                self.plot=[]
-                i_start=0
-                counter=0
-                while i_start<N_y:
-                    pen = mkPen(color=colors[counter], width=3)
-                    i_stop=min([i_start+step,N_y-1])
-                    temp=PlotCurveItem(x=x_data[i_start:i_stop+1],y=y_data[i_start:i_stop+1], pen=pen)
-                    i_start=i_stop+1
-                    self.plot.append(temp)
-                    self.figure.plotItem.vb.addItem(temp)
-                    counter+=1
+            new_data=self.source.load_new(self.last_date,self.last_date_rows,self.end_date)
+        except Exception as e:
+            self.failed.emit(f"Polling failed: {type(e).__name__}: {e}")
+            return
+        if new_data is not None:
+            self.appended.emit(dataset.from_columns(*new_data))
+
+class startup_timer:
+    """
+    Collects startup timings and prints them once data loading has finished and the window has been painted
+    """
+    def __init__(self,start_time):
+        self.start_time=start_time
+        self.times={}
+        self.durations={}
+        self.loading_done=False
+        self.reported=False
+    def mark(self,stage):
+        """
+        Record the time elapsed since start_time when stage is first reached
+        """
+        if stage not in self.times:
+            self.times[stage]=time.perf_counter()-self.start_time
+            self.report()
+    def add_duration(self,stage,duration):
+        self.durations[stage]=duration
+    def finish_loading(self):
+        self.loading_done=True
+        self.report()
+    def report(self):
+        if self.reported or not self.loading_done or 'first paint' not in self.times:
+            return
+        self.reported=True
+        print('Startup: '+', '.join([f"{stage} {duration:.3f} s" for stage,duration in self.durations.items()]+
+                                    [f"{stage} at {elapsed:.3f} s" for stage,elapsed in self.times.items()]))
+
 class main_window(QWidget):
-    def __init__(self,dates_formatted,data_dict,moving_average_dict,info_columns_dict,styles={"font-family":"Times New Roman"}):
+    def __init__(self,styles={"font-family":"Times New Roman"},startup_timer=None,precomputed_windows=(7,14,30,90)):
         super().__init__()
+        self.startup_timer=startup_timer
+        self.precomputed_windows=precomputed_windows
         self.setWindowTitle('Body-metric log visualizer')
-        self.setWindowIcon(QIcon('scale.png'))
+        self.setWindowIcon(QIcon(os.path.join(os.path.dirname(os.path.abspath(__file__)),'scale.png')))
+        self.styles=styles
+        self.data=None
+        self.history_plot_widget=None
+        self.data_comparison_plot=None
         self.start_line_edit=QLineEdit()
         self.end_line_edit=QLineEdit()
         self.moving_avgerage_window_line_edit=QLineEdit()
         self.moving_avgerage_window_line_edit.setText('7')
+        self.resolution_picker=QComboBox()
+        self.resolution_picker.addItems(['Entries','Days','Weeks','Months','Years'])
+        #keys=periods, values=backend.calendar_aggregate of self.data
+        self.aggregates={}
+        self.status_label=QLabel('Loading data...')
         ctrlLayout=stack_in_layout([QLabel('From, Year,Month,Day:'),self.start_line_edit,
                                     QLabel('Until, Year,Month,Day:'),self.end_line_edit,
-                                    QLabel('Avg. window:'),self.moving_avgerage_window_line_edit],'h')
-        self.history_plot_widget=chronological_plotter(dates_formatted,data_dict,moving_average_dict,info_columns_dict,styles)
-        tab_widget=QTabWidget()
-        tab_widget.addTab(self.history_plot_widget,'History')
-        self.data_comparison_plot=data_analysis_plotter(dates_formatted,data_dict,moving_average_dict,styles)
-        tab_widget.addTab(self.data_comparison_plot,'Comparison')
+                                    QLabel('Avg. window:'),self.moving_avgerage_window_line_edit,
+                                    QLabel('Show:'),self.resolution_picker,self.status_label],'h')
+        self.tab_widget=QTabWidget()
+        layout=stack_in_layout([self.tab_widget,ctrlLayout])
+        self.setLayout(layout)
+
+        self.start_line_edit.returnPressed.connect(self.update_start)
+        self.end_line_edit.returnPressed.connect(self.update_end)
+        self.moving_avgerage_window_line_edit.returnPressed.connect(self.update_moving_average)
+        self.resolution_picker.currentIndexChanged.connect(self.build_tabs)
+    def set_data(self,data):
+        """
+        Build (or rebuild) the History and Comparison tabs for newly loaded data, the selected tab and range are kept when possible
+
+        Inputs:
+        data: backend.dataset
+        """
+        if len(data)==0:
+            self.show_status('No data to show')
+            return
+        self.data=data
+        self.aggregates={}
+        self.build_tabs()
+    def get_aggregate(self):
+        """
+        Output: backend.calendar_aggregate of the data for the period picked in resolution_picker, None to show every entry
+        """
+        period=[None,'day','week','month','year'][self.resolution_picker.currentIndex()]
+        if period is None:
+            return None
+        if period not in self.aggregates:
+            self.aggregates[period]=calendar_aggregate(self.data,period)
+        return self.aggregates[period]
+    def build_tabs(self):
+        """
+        Build (or rebuild) the History and Comparison tabs for the data, per entry or aggregated per calendar period
+        """
+        if self.data is None:
+            return
+        aggregate=self.get_aggregate()
+        data=aggregate.data if aggregate else self.data
+        moving_average_dict=moving_average_cache(data)
+        moving_average_dict.precompute(self.precomputed_windows)
+        current_tab=self.tab_widget.currentIndex()
+        start_str=self.start_line_edit.text()
+        end_str=self.end_line_edit.text()
+        if self.history_plot_widget is not None:
+            self.tab_widget.clear()
+            self.history_plot_widget.deleteLater()
+            self.data_comparison_plot.deleteLater()
+        self.history_plot_widget=chronological_plotter(data,moving_average_dict,self.styles,aggregate)
+        self.tab_widget.addTab(self.history_plot_widget,'History')
+        self.data_comparison_plot=data_analysis_plotter(data,moving_average_dict,self.styles,aggregate)
+        self.data_comparison_plot.formula_checked.connect(self.show_formula_check)
+        self.tab_widget.addTab(self.data_comparison_plot,'Comparison')
+        self.tab_widget.setCurrentIndex(max(current_tab,0))
 
-        for i in range(tab_widget.count()):
-            tab_page = tab_widget.widget(i)
+        for i in range(self.tab_widget.count()):
+            tab_page = self.tab_widget.widget(i)
             pal = tab_page.palette()
             pal.setColor(QPalette.ColorRole.Window, self.history_plot_widget.palette().color(QPalette.ColorRole.Window))
             tab_page.setAutoFillBackground(True)   # important so palette is used
             tab_page.setPalette(pal)
             tab_page.update()
 
-        layout=stack_in_layout([tab_widget,ctrlLayout])
-        self.setLayout(layout)
-
-        self.start_line_edit.returnPressed.connect(self.update_start)
-        self.end_line_edit.returnPressed.connect(self.update_end)
-        self.moving_avgerage_window_line_edit.returnPressed.connect(self.update_moving_average)
-        self.start_line_edit.setText(dates_formatted[0])
-        self.end_line_edit.setText(dates_formatted[-1])    
+        if self.moving_avgerage_window_line_edit.text()!='7':
+            self.update_moving_average()
+        if not self.valid_date(start_str):
+            self.start_line_edit.setText(data.date_str(0))
+        if not self.valid_date(end_str):
+            self.end_line_edit.setText(data.date_str(-1))
         self.start_line_edit.returnPressed.emit()
         self.end_line_edit.returnPressed.emit()
+    def append_data(self,new_data):
+        """
+        Append polled rows to the shown data, the moving averages and curves are extended instead of rebuilt
+
+        Inputs:
+        new_data: backend.dataset with the rows dated on or after the last shown row
+        """
+        if self.data is None or len(new_data)==0:
+            return
+        old_N=len(self.data)
+        try:
+            self.data.append(new_data)
+        except ValueError as e:
+            self.show_error(f"Polling failed: {e}")
+            return
+        self.aggregates={}
+        if self.resolution_picker.currentIndex()>0:
+            #the last period of an aggregated view changes, so the view is recomputed
+            if self.history_plot_widget.end_index==len(self.history_plot_widget.data)-1:
+                self.end_line_edit.setText(self.data.date_str(-1))
+            self.build_tabs()
+        else:
+            self.history_plot_widget.moving_average_dict.extend(old_N)
+            self.history_plot_widget.extend(old_N)
+            self.data_comparison_plot.extend(old_N)
+            if self.history_plot_widget.end_index==len(self.data)-1:
+                self.end_line_edit.setText(self.data.date_str(-1))
+        self.show_status(f"{len(new_data)} new rows at {time.strftime('%H:%M')}")
+    def paintEvent(self,event):
+        super().paintEvent(event)
+        if self.startup_timer:
+            self.startup_timer.mark('first paint')
+    def show_status(self,message):
+        self.status_label.setStyleSheet('')
+        self.status_label.setText(message)
+    def show_error(self,message):
+        self.status_label.setStyleSheet('color: red;')
+        self.status_label.setText(message)
+    def show_formula_check(self,message):
+        if message:
+            self.show_error(message)
+        else:
+            self.show_status('')
+    def valid_date(self,date_str):
+        try:
+            self.data.index.lookup(date_str)
+        except ValueError:
+            return False
+        return True
     def update_start(self):
+        if self.history_plot_widget is None:
+            return
         startStr=self.start_line_edit.text()
+        if not self.valid_date(startStr):
+            self.show_error(f"Invalid start date: {startStr}")
+            return
+        self.show_status('')
         self.history_plot_widget.update_start(startStr)
         self.data_comparison_plot.set_start_index(startStr)
     def update_end(self):
+        if self.history_plot_widget is None:
+            return
         endStr=self.end_line_edit.text()
+        if not self.valid_date(endStr):
+            self.show_error(f"Invalid end date: {endStr}")
+            return
+        self.show_status('')
         self.history_plot_widget.update_end(endStr)
         self.data_comparison_plot.set_end_index(endStr)
     def update_moving_average(self):
+        if self.history_plot_widget is None:
+            return
         self.history_plot_widget.update_moving_average(int(self.moving_avgerage_window_line_edit.text()))
-        self.data_comparison_plot.plot_data()
+        self.data_comparison_plot.redraw_scheduler.request()
 
 if __name__=='__main__':
-    mock_bool=False
-    if mock_bool:
-        dates_formatted,data_dict,info_columns_dict=get_mock_data()
-    else:
-        dates_formatted,data_dict,info_columns_dict=get_data()
-    moving_average_dict={key:None for key in data_dict.keys()}
+    parser=argparse.ArgumentParser(description='Body-metric log visualizer')
+    add_source_arguments(parser)
+    parser.add_argument('--poll',type=float,help='check the data source for new rows every POLL seconds')
+    parser.add_argument('--timing-overlay',action='store_true',help='show the last redraw duration and the frame rate on the plots')
+    parser.add_argument('--precompute-windows',default='7,14,30,90',help='comma-separated moving average windows to compute in the background')
+    args=parser.parse_args()
+    source=source_from_arguments(parser,args)
+    load_steps=source.load_steps(args.start,args.end)
+    profiling.show_overlay=profiling.show_overlay or args.timing_overlay
+    profiling.start_session()
 
+    timer=startup_timer(startup_time)
+    timer.add_duration('imports',import_duration)
     app=QApplication([])
     app.setFont(QFont('Times New Roman'))
-    gui=main_window(dates_formatted,data_dict,moving_average_dict,info_columns_dict)
+    gui=main_window(startup_timer=timer,precomputed_windows=[int(window) for window in args.precompute_windows.split(',') if window.strip()])
     gui.show()
-    app.exec()
\ No newline at end of file
+    timer.mark('window shown')
+    loader=data_loader(load_steps)
+    loader.progress.connect(gui.show_status)
+    loader.failed.connect(gui.show_error)
+    loader.loaded.connect(gui.set_data)
+    loader.step_finished.connect(timer.add_duration)
+    loader.finished.connect(timer.finish_loading)
+    if args.poll:
+        poller=data_poller(source,args.end)
+        poller.appended.connect(gui.append_data)
+        poller.failed.connect(gui.show_error)
+        poll_timer=QTimer()
+        poll_timer.setInterval(int(args.poll*1000))
+        poll_timer.timeout.connect(lambda:poller.poll(gui.data))
+        #polling starts once the initial load has finished, so the polled rows follow the loaded ones
+        loader.finished.connect(poll_timer.start)
+    loader.start()
+    app.exec()
+    loader.wait()
+    if args.poll:
+        poller.wait()
@@ -0,0 +1,92 @@
+"""
+Timing instrumentation of the slow stages: the Sheets fetch, parsing, moving averages, formula evaluation and plot rebuilds.
+Switched on with environment variables, which are read when this module is first imported:
+
+BODYLOG_TIMINGS=<file>   append one JSON line per timed call to file ('-' for stderr), e.g.
+                         {"stage": "parse", "duration_s": 0.41, "time": 1718000000.1, "thread": "MainThread", "pid": 123}
+BODYLOG_OVERLAY=1        show the duration of the last redraw and the frame rate on the plots (main.py --timing-overlay)
+BODYLOG_CPROFILE=<file>  run the session under cProfile and dump the stats to file on exit, read them with
+                         python -m pstats <file>
+
+Without BODYLOG_TIMINGS the timed decorator returns the functions unchanged, so the hooks cost nothing.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+
+log_path=os.environ.get('BODYLOG_TIMINGS') or None
+cprofile_path=os.environ.get('BODYLOG_CPROFILE') or None
+show_overlay=bool(os.environ.get('BODYLOG_OVERLAY'))
+log_lock=threading.Lock()
+log_file=None
+profilers=[]
+
+def timed(stage):
+    """
+    Decorator recording the duration of each call of a function as stage, returns the function itself if timing is off
+    """
+    def decorator(function):
+        if log_path is None:
+            return function
+        @functools.wraps(function)
+        def wrapper(*args,**kwargs):
+            start_time=time.perf_counter()
+            try:
+                return function(*args,**kwargs)
+            finally:
+                record(stage,time.perf_counter()-start_time)
+        return wrapper
+    return decorator
+
+def record(stage,duration,**fields):
+    """
+    Append a timing to the log, if enabled
+
+    Inputs:
+    stage: name of the timed stage
+    duration: duration in seconds
+    fields: further JSON-serializable values to include in the line
+    """
+    global log_file
+    if log_path is None:
+        return
+    line=json.dumps({'stage':stage,'duration_s':duration,'time':time.time(),'thread':threading.current_thread().name,'pid':os.getpid(),**fields})
+    with log_lock:
+        if log_file is None:
+            log_file=sys.stderr if log_path=='-' else open(log_path,'a',buffering=1)
+        log_file.write(line+'\n')
+
+def start_session():
+    """
+    Start profiling the calling thread with cProfile if BODYLOG_CPROFILE is set, the stats of all profiled threads are dumped on exit
+    """
+    if cprofile_path is None:
+        return
+    if not profilers:
+        atexit.register(dump_stats)
+    profile_thread()
+
+def profile_thread():
+    """
+    Profile the calling thread as part of the session (cProfile only follows the thread it was enabled in)
+    """
+    if cprofile_path is None:
+        return
+    import cProfile
+    profiler=cProfile.Profile()
+    with log_lock:
+        profilers.append(profiler)
+    profiler.enable()
+
+def dump_stats():
+    import pstats
+    with log_lock:
+        for profiler in profilers:
+            profiler.disable()
+        stats=pstats.Stats(*profilers)
+    stats.dump_stats(cprofile_path)
+    print(f"Profile written to {cprofile_path}",file=sys.stderr)
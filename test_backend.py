@@ -0,0 +1,184 @@
+import warnings
+import numpy as np
+import pytest
+
+from backend import moving_average, moving_average_changed_from, compile_formula, evaluate_formula, generate_data, dataset, local_worksheet, fetch_columns, parse_columns, sync_cache
+
+def reference_moving_average(data,window):
+    """
+    The loop moving_average replaced, kept as the reference its results are checked against
+    """
+    moving_average_data=[]
+    half_window=window//2
+    N=len(data)
+    for i in range(N):
+        start_index=np.max([0,i-half_window])
+        if np.isnan(data[i]):
+            moving_average_data.append(np.nan)
+        else:
+            if start_index==0:
+                end_index=np.max([1,i*2])
+            else:
+                end_index=np.min([N-1,start_index+window])
+            data_slice=data[start_index:end_index]
+            data_slice_finite=[d for d in data_slice if np.isfinite(d)]
+            try:
+                moving_average_data.append(np.mean(data_slice_finite))
+            except:
+                moving_average_data.append(np.nan)
+    return np.array(moving_average_data)
+
+def random_series(rng,N):
+    data=np.round(rng.normal(80,5,N),1)
+    special=rng.random(N)
+    data[special<0.15]=np.nan
+    data[(special>=0.15)&(special<0.2)]=np.inf
+    data[(special>=0.2)&(special<0.22)]=-np.inf
+    return data
+
+@pytest.mark.parametrize('N',[0,1,2,3,7,20,61])
+def test_moving_average_matches_reference(N):
+    rng=np.random.default_rng(N)
+    for _ in range(5):
+        data=random_series(rng,N)
+        for window in range(N+2):
+            with warnings.catch_warnings():
+                #the reference averages empty slices
+                warnings.simplefilter('ignore',RuntimeWarning)
+                expected=reference_moving_average(data,window)
+            result=moving_average(data,window)
+            assert result.shape==expected.shape
+            assert np.allclose(result,expected,rtol=1e-12,atol=0,equal_nan=True),(N,window)
+
+@pytest.mark.parametrize('window',[0,1,2,7,30])
+def test_moving_average_tail_matches_full(window):
+    rng=np.random.default_rng(window)
+    data=random_series(rng,50)
+    full=moving_average(data,window)
+    start_index=moving_average_changed_from(40,window)
+    assert np.allclose(moving_average(data,window,start_index),full[start_index:],rtol=1e-12,atol=0,equal_nan=True)
+
+def recursive_parse(str_to_parse,data_formula_map_dict,data_dict,days):
+    """
+    The recursive formula evaluation evaluate_formula replaced, kept as the reference its results are checked against
+    """
+    operators={'*','+','-','/'}
+    str_to_parse.replace(' ','')
+    temp=''
+    is_number=False
+    to_evaluate=[]
+    to_operate=[]
+    iter=0
+    while iter<len(str_to_parse):
+        ch=str_to_parse[iter]
+        iter+=1
+        if ch=='(':
+            rec_result,rec_iter=recursive_parse(str_to_parse[iter:],data_formula_map_dict,data_dict,days)
+            to_evaluate.append(rec_result)
+            iter+=rec_iter
+        elif ch==')':
+            break
+        elif ch.isnumeric():
+            temp+=ch
+            is_number=True
+        elif ch in operators:
+            if is_number:
+                to_evaluate.append(float(temp))
+                is_number=False
+            temp=''
+            to_operate.append(ch)
+        else:
+            data_symbol=data_formula_map_dict[ch]
+            if data_symbol in data_dict:
+                to_evaluate.append(data_dict[data_symbol])
+            else:
+                to_evaluate.append(days)
+    if temp!='':
+        to_evaluate.append(float(temp))
+    to_add_subtract=[to_evaluate[0]]
+    add_subtract_operators=[]
+    for i,operator in enumerate(to_operate,start=1):
+        if operator=='*':
+            to_add_subtract[-1]=to_add_subtract[-1]*to_evaluate[i]
+        elif operator=='/':
+            to_add_subtract[-1]=to_add_subtract[-1]/to_evaluate[i]
+        else:
+            to_add_subtract.append(to_evaluate[i])
+            add_subtract_operators.append(operator)
+    result=to_add_subtract[0]
+    for operator,operand in zip(add_subtract_operators,to_add_subtract[1:]):
+        if operator=='-':
+            result-=operand
+        else:
+            result+=operand
+    return result,iter
+
+formula_labels=['Weight [kg]','Waist [cm]','Body fat [%]','Body fat [kg]','Hydration [%]','Days']
+
+@pytest.mark.parametrize('formula',['A','A+B','A-B-C','A/B*C','2*A-3','12-A/B','(A+B)/2','A/(B-C)*10','((A+B)*(C-D))/E',
+                                    'F*2+A','(A)','(A-B)*(C+D)-(E/F)','F/(1+F)'])
+def test_evaluate_formula_matches_reference(formula):
+    rng=np.random.default_rng(len(formula))
+    data_formula_map_dict={chr(65+i):label for i,label in enumerate(formula_labels)}
+    data_dict={label:random_series(rng,40) for label in formula_labels[:-1]}
+    data_dict['Body fat [kg]'][3]=0.0
+    days=np.arange(40,dtype=float)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        #the reference adds and subtracts in place into its first operand, so it is given copies
+        expected=np.broadcast_to(recursive_parse(formula,data_formula_map_dict,{label:values.copy() for label,values in data_dict.items()},
+                                                 days.copy())[0],days.shape)
+    result=evaluate_formula(formula,data_formula_map_dict,data_dict,days)
+    assert np.allclose(result,expected,rtol=1e-12,atol=0,equal_nan=True)
+    assert np.allclose(evaluate_formula(formula,data_formula_map_dict,data_dict,days,5,30),expected[5:30],rtol=1e-12,atol=0,equal_nan=True)
+
+@pytest.mark.parametrize('formula',['','A+','*A','A B','(A+B))','2(A)'])
+def test_compile_formula_rejects_invalid(formula):
+    with pytest.raises(ValueError):
+        compile_formula(formula)
+
+#the dates of sync_data change year at row 267
+sync_data=generate_data(400,1)
+
+def sheet_cells(end_index):
+    return local_worksheet.from_dataset(sync_data.view(0,end_index)).cells
+
+def edited(cells,row,column,value):
+    cells=[list(cells_row) for cells_row in cells]
+    cells[row][column]=value
+    return cells
+
+@pytest.mark.parametrize('old_cells,new_cells',[
+    #rows added at the top
+    (sheet_cells(240),sheet_cells(250)),
+    #rows of a new year added at the top, with its year row
+    (sheet_cells(267),sheet_cells(270)),
+    #edits of the most recent rows, with and without rows added
+    (sheet_cells(250),edited(sheet_cells(250),3,1,'99.5')),
+    (sheet_cells(250),edited(sheet_cells(252),6,7,'edited')),
+    #empty rows added at the bottom
+    (sheet_cells(250),sheet_cells(250)+[['']*9]*5),
+    (sheet_cells(250),sheet_cells(252)+[['']*9]*5),
+    #header change
+    (sheet_cells(250),edited(sheet_cells(251),0,2,'Waist')),
+    #row deletions, below the synced rows and at the top
+    (sheet_cells(250),sheet_cells(250)[:100]+sheet_cells(250)[101:]),
+    (sheet_cells(250),sheet_cells(252)[:1]+sheet_cells(252)[2:]),
+])
+def test_sync_cache_matches_full_parse(tmp_path,old_cells,new_cells):
+    cache_dir=str(tmp_path/'cache')
+    sync_cache(local_worksheet(old_cells),cache_dir)
+    expected=dataset.from_columns(*parse_columns(fetch_columns(local_worksheet(new_cells))[1]))
+    #synced twice, the second time from the cache written by the first
+    for _ in range(2):
+        assert dataset.from_columns(*sync_cache(local_worksheet(new_cells),cache_dir)).equals(expected)
+
+def test_sync_cache_changes_are_a_tail_of_whole_dates(tmp_path):
+    cache_dir=str(tmp_path/'cache')
+    data=generate_data(400,2,max_entries_per_day=3)
+    sync_cache(local_worksheet.from_dataset(data.view(0,300)),cache_dir)
+    for end_index in [300,301,310,320,320]:
+        changes=dataset.from_columns(*sync_cache(local_worksheet.from_dataset(data.view(0,end_index)),cache_dir,changes=True))
+        start_index=end_index-len(changes)
+        assert 0<start_index<end_index
+        assert changes.equals(data.view(start_index,end_index))
+        assert data.dates[start_index-1]<data.dates[start_index]